@@ -3,36 +3,208 @@ import lxml.html
 import lxml.etree as etree
 import traceback
 import datetime
+import hashlib
+import html
+import json
 from collections import defaultdict, deque
+from collections.abc import MutableMapping
+from concurrent.futures import Future, ThreadPoolExecutor
 import itertools
 import pytz
 import icalendar
 import re
+import requests
+import scrapelib
+import threading
+import time
+from urllib.parse import parse_qs, urljoin, urlsplit
 
-class LegistarScraper(Scraper):
+from . import xpaths
+from .dedupe import DedupeMixin
+from .throttle import SharedThrottleMixin
+
+# Use a faster JSON decoder if one is installed
+try :
+    from orjson import loads as json_loads
+except ImportError :
+    try :
+        from ujson import loads as json_loads
+    except ImportError :
+        def json_loads(content) :
+            # json.loads only takes bytes from Python 3.6 on
+            if isinstance(content, bytes) :
+                content = content.decode('utf-8')
+            return json.loads(content)
+
+GRID_TABLE = "//table[contains(@class, 'rgMasterTable')]"
+
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+SESSION_FIELDS = ('__VIEWSTATE', '__VIEWSTATEGENERATOR', '__EVENTVALIDATION')
+
+class LegistarScraper(DedupeMixin, SharedThrottleMixin, Scraper):
     date_format='%m/%d/%Y'
 
+    # A legistar.cache.ConditionalCache. When set, GET requests are
+    # revalidated against the cache instead of downloaded in full.
+    response_cache = None
+
+    # Number of grid pages to request at once. With more than one
+    # worker, pages() fetches every page linked from the pager at the
+    # same time instead of following the links one by one.
+    page_workers = 1
+
+    # Number of rows per page to ask search grids for. The Telerik grids
+    # Legistar uses default to small pages. If the server ignores the
+    # request, we page through the grid at its default size.
+    grid_page_size = None
+
+    # Download whole search grids with their Export to Excel command
+    # instead of paging through them. See gridRows.
+    grid_export = False
+
+    # iCalendar links in data tables are fetched when they are first
+    # used. With more than one worker, parseDataTable starts fetching
+    # all of a table's iCalendars, this many at a time, as soon as it
+    # gets the table.
+    ical_workers = 1
+
+    # A legistar.state store, like JSONStateStore. When set, pages()
+    # saves a checkpoint before asking for each page of a grid after the
+    # first, so a search that is cut off by an error, a dropped
+    # connection say, can pick up where it stopped. The checkpoint is
+    # deleted when paging finishes or the caller stops, so the store
+    # needs a delete method too. Only used when page_workers is 1.
+    checkpoint_store = None
+
+    # Resume searches from their checkpoints. Set this only for a run
+    # that retries one that was cut off, since resuming skips the pages
+    # the earlier run got. Checkpoints older than checkpoint_max_age
+    # seconds are ignored.
+    resume_checkpoints = False
+    checkpoint_max_age = 60 * 60
+
+    # Make the rows of data tables GridRows instead of dicts. They take
+    # much less memory, which adds up over a big legislation search,
+    # but they are not dicts, so check your scraper works with them.
+    compact_rows = False
+
+    # When a caller says which elements of a page it needs, only parse
+    # those and the hidden form fields, skipping the rest of the page.
+    # See parseRegions.
+    region_parsing = False
+
+    # Making every link on a page absolute walks the whole tree, though
+    # we only read a few of the links. Set this to False to leave links
+    # as they are on the page. Links read through _get_link_address,
+    # like those in parseDataTable and parseDetails, are still made
+    # absolute.
+    absolute_links = True
+
     def __init__(self, *args, **kwargs) :
         super(LegistarScraper, self).__init__(*args, **kwargs)
         self.timeout = 600
+        self._icalendars = {}
 
-    def lxmlize(self, url, payload=None):
+        # Total seconds spent fetching and parsing HTML pages. lxml
+        # decodes pages as it parses them, so decoding counts as parsing.
+        self.page_timings = {'pages' : 0, 'network' : 0.0, 'parse' : 0.0}
+        self._timings_lock = threading.Lock()
+
+    def lxmlize(self, url, payload=None, regions=None):
+        """
+        Fetch and parse a page. If region_parsing is set, and regions is
+        a list of element ids, only those elements and the hidden form
+        fields are parsed.
+        """
+        return self._parsePage(url, self._fetchPage(url, payload), regions)
+
+    def _fetchPage(self, url, payload=None) :
+        start = time.perf_counter()
         if payload :
-            entry = self.post(url, payload, verify=False).text
+            response = self.post(url, payload, verify=False)
         else :
-            entry = self.get(url, verify=False).text
-        page = lxml.html.fromstring(entry)
-        page.make_links_absolute(url)
+            response = self._get(url, verify=False)
+
+        self._recordTimings(network=time.perf_counter() - start)
+
+        return response
+
+    def _parsePage(self, url, response, regions=None) :
+        start = time.perf_counter()
+
+        # We parse the bytes ourselves, rather than response.text, so
+        # requests never has to guess the encoding
+        content = response.content
+        encoding = response.encoding
+
+        page = None
+        if regions and self.region_parsing :
+            page = parseRegions(content, regions, encoding or 'utf-8', url)
+
+        # If we couldn't find one of the regions, fall back to parsing
+        # the whole page
+        if page is None :
+            page = lxml.html.fromstring(content,
+                                        parser=htmlParser(encoding),
+                                        base_url=url)
+
+        if self.absolute_links :
+            page.make_links_absolute(url)
+        else :
+            page.resolve_base_href()
+
+        parsed = time.perf_counter()
+        self._recordTimings(pages=1, parse=parsed - start)
+        self.debug('{0}: parsed in {1:.3f}s'.format(url, parsed - start))
+
         return page
 
-    def pages(self, url, payload=None) :
-        page = self.lxmlize(url, payload)
+    def _recordTimings(self, **timings) :
+        with self._timings_lock :
+            for stage, value in timings.items() :
+                self.page_timings[stage] += value
+
+    def _get(self, url, **kwargs) :
+        if self.response_cache is not None :
+            return self.response_cache.get(self, url, **kwargs)
+        return self.get(url, **kwargs)
+
+    def _worker(self) :
+        """
+        Return a copy of this scraper with its own cookie jar, so it can
+        run a search in another thread without mixing up its postback
+        chain with ours. Connection pools and the request throttle are
+        still shared.
+        """
+        worker = object.__new__(type(self))
+        worker.__dict__.update(self.__dict__)
+        worker.cookies = requests.cookies.RequestsCookieJar()
+        return worker
+
+    def pages(self, url, payload=None, page_size=None, regions=None,
+              table_xpath=GRID_TABLE) :
+        """
+        Yield every page of the grid on url. If page_size is given, we
+        first ask the grid that table_xpath finds to show that many rows
+        per page.
+        """
+        if self.checkpoint_store is not None and self.page_workers <= 1 :
+            return self._checkpointedPages(url, payload, page_size, regions,
+                                           table_xpath)
+
+        return self._pages(url, payload, page_size, regions, table_xpath)
+
+    def _pages(self, url, payload, page_size, regions, table_xpath) :
+        page = self._firstPage(url, payload, page_size, regions, table_xpath)
         
         yield page
 
-        next_page = page.xpath("//a[@class='rgCurrentPage']/following-sibling::a[1]")
-        if payload and 'ctl00$ContentPlaceHolder1$btnSearch' in payload:
-            del payload['ctl00$ContentPlaceHolder1$btnSearch']
+        next_page = xpaths.NEXT_PAGE(page)
+
+        if self.page_workers > 1 :
+            yield from self._pageBlocks(url, payload or {}, page, regions)
+            return
 
         while len(next_page) > 0 :
             if payload is None:
@@ -44,20 +216,189 @@ class LegistarScraper(Scraper):
 
             payload['__EVENTTARGET'] = event_target
 
-            page = self.lxmlize(url, payload)
+            page = self.lxmlize(url, payload, regions)
 
             yield page
 
-            next_page = page.xpath("//a[@class='rgCurrentPage']/following-sibling::a[1]")
+            next_page = xpaths.NEXT_PAGE(page)
+
+    def _firstPage(self, url, payload, page_size, regions, table_xpath) :
+        page = self.lxmlize(url, payload, regions)
+
+        if payload and 'ctl00$ContentPlaceHolder1$btnSearch' in payload:
+            del payload['ctl00$ContentPlaceHolder1$btnSearch']
+
+        if page_size :
+            page = self._resizeGrid(url, payload, page, page_size, regions,
+                                    table_xpath)
+
+        return page
+
+    def _checkpointedPages(self, url, payload, page_size, regions,
+                           table_xpath) :
+        """
+        Page through a grid like pages(), saving a checkpoint before we
+        ask for each page after the first: the page's index, the payload
+        we post for it and our cookies.
+
+        With resume_checkpoints set, a search with the same url and
+        payload as one that was stopped by an error starts by posting
+        the saved payload, if the checkpoint is less than
+        checkpoint_max_age seconds old. If the server won't take the
+        saved ViewState any more, we search again from the start and
+        yield every page, so the caller's dedupe index has to drop the
+        items it has seen.
+        """
+        name = checkpointName(url, payload)
+        checkpoint = None
+        if self.resume_checkpoints :
+            checkpoint = self.checkpoint_store.get(self.BASE_URL, name)
+            if checkpoint and time.time() - checkpoint['saved'] > self.checkpoint_max_age :
+                self.warning('Checkpoint for {0} is too old to resume, searching again'.format(url))
+                checkpoint = None
+
+        page = None
+        page_num = 0
+        if checkpoint :
+            page = self._resumePages(url, checkpoint, regions)
+            if page is None :
+                self.warning('Could not resume {0} at page {1}, searching again'.format(url, checkpoint['page'] + 1))
+            else :
+                page_num = checkpoint['page']
+                payload = checkpoint['payload']
+
+        if page is None :
+            page = self._firstPage(url, payload, page_size, regions,
+                                   table_xpath)
+
+        if payload is None :
+            payload = {}
+
+        try :
+            while True :
+                yield page
+
+                next_page = xpaths.NEXT_PAGE(page)
+                if not next_page :
+                    break
 
+                payload.update(self.sessionSecrets(page))
+                payload['__EVENTTARGET'] = next_page[0].attrib['href'].split("'")[1]
+                page_num += 1
+
+                self._saveCheckpoint(name, page_num, payload)
+
+                page = self.lxmlize(url, payload, regions)
+
+        except GeneratorExit :
+            # The caller stopped paging, so there's nothing to resume.
+            # Only an error while we fetch a page keeps the checkpoint.
+            self.checkpoint_store.delete(self.BASE_URL, name)
+            raise
+
+        self.checkpoint_store.delete(self.BASE_URL, name)
+
+    def _resumePages(self, url, checkpoint, regions) :
+        """
+        Post the payload saved in checkpoint, with its cookies, and
+        return the page we get if it is the page we were asking for
+        """
+        cookies = self.cookies.copy()
+        for cookie in checkpoint['cookies'] :
+            self.cookies.set(cookie['name'], cookie['value'],
+                             domain=cookie['domain'], path=cookie['path'])
+
+        try :
+            page = self.lxmlize(url, checkpoint['payload'], regions)
+        except scrapelib.HTTPError as e :
+            self.warning('Saved search of {0} was rejected: {1}'.format(url, e))
+            page = None
+        else :
+            # If the ViewState has expired, we may get the search form,
+            # or the first page, back instead
+            current_page = xpaths.CURRENT_PAGE(page)
+            if not (current_page and
+                    current_page[0].text_content().strip() == str(checkpoint['page'] + 1)) :
+                page = None
+
+        if page is None :
+            self.cookies = cookies
+
+        return page
+
+    def _saveCheckpoint(self, name, page_num, payload) :
+        cookies = [{'name' : cookie.name,
+                    'value' : cookie.value,
+                    'domain' : cookie.domain,
+                    'path' : cookie.path}
+                   for cookie in self.cookies]
+
+        self.checkpoint_store.set(self.BASE_URL, name,
+                                  {'page' : page_num,
+                                   'payload' : payload,
+                                   'cookies' : cookies,
+                                   'saved' : time.time()})
+
+    def _pageBlocks(self, url, payload, page, regions=None) :
+        """
+        A grid page links to the next several pages (and to the next
+        block of pages), and all those links can be posted with the
+        ViewState of the page we are on. So we fetch every linked page
+        at once, yield them in order, and continue from the last one.
+        """
+        with ThreadPoolExecutor(max_workers=self.page_workers) as executor :
+            while True :
+                links = xpaths.PAGE_LINKS(page)
+                if not links :
+                    return
+
+                secrets = self.sessionSecrets(page)
+                payloads = []
+                for link in links :
+                    link_payload = dict(payload)
+                    link_payload.update(secrets)
+                    link_payload['__EVENTTARGET'] = link.attrib['href'].split("'")[1]
+                    payloads.append(link_payload)
+
+                for page in executor.map(lambda p : self.lxmlize(url, p, regions),
+                                         payloads) :
+                    yield page
+
+    def _resizeGrid(self, url, payload, page, page_size, regions=None,
+                    table_xpath=GRID_TABLE) :
+        """
+        Ask the grid that table_xpath finds on page to show page_size
+        rows per page, so it takes fewer postbacks, each reposting the
+        whole ViewState, to page through it. Returns the resized page, or
+        the original page if the server ignored us.
+        """
+        if not xpaths.NEXT_PAGE(page) :
+            return page
+
+        table_xpath = xpaths.compiled(table_xpath)
+        table = table_xpath(page)[0]
+
+        grid, table_view = gridTarget(table)
+
+        resize_payload = dict(payload or {})
+        resize_payload.update(self.sessionSecrets(page))
+        resize_payload['__EVENTTARGET'] = grid
+        resize_payload['__EVENTARGUMENT'] = 'FireCommand:{0};PageSize;{1}'.format(table_view, page_size)
+
+        resized = self.lxmlize(url, resize_payload, regions)
+
+        resized_table = table_xpath(resized)
+        if resized_table and gridRowCount(resized_table[0]) > gridRowCount(table) :
+            return resized
+        else :
+            self.warning('{0} ignored page size of {1}, using the default'.format(url, page_size))
+            return page
 
     def parseDetails(self, detail_div) :
         """
         Parse the data in the top section of a detail page.
         """
-        detail_query = ".//*[starts-with(@id, 'ctl00_ContentPlaceHolder1_lbl')"\
-                       "     or starts-with(@id, 'ctl00_ContentPlaceHolder1_hyp')]"
-        fields = detail_div.xpath(detail_query)
+        fields = xpaths.DETAIL_FIELDS(detail_div)
         details = {}
 
         for field_key, field in itertools.groupby(fields, 
@@ -67,7 +408,7 @@ class LegistarScraper(Scraper):
             key = field_1.text_content().replace(':', '').strip()
             if field_2.find('.//a') is not None :
                 value = []
-                for link in field_2.xpath('.//a') :
+                for link in xpaths.LINKS(field_2) :
                     value.append({'label' : link.text_content().strip(),
                                   'url' : self._get_link_address(link)})
             elif 'href' in field_2.attrib :
@@ -87,8 +428,52 @@ class LegistarScraper(Scraper):
         places. This will return a list of dictionaries using the
         table headers as keys.
         """
-        headers = table.xpath(".//th[starts-with(@class, 'rgHeader')]")
-        rows = table.xpath(".//tr[@class='rgRow' or @class='rgAltRow']")
+        rows = xpaths.GRID_ROWS(table)
+
+        keys = self._headerKeys(table)
+        schema = self._rowSchema(keys)
+
+        if self.ical_workers > 1 :
+            self._prefetchICalendars(rows)
+
+        for row in rows:
+            yield self._parseRow(keys, row, schema), keys, row
+
+    def _prefetchICalendars(self, rows) :
+        """
+        Start fetching the iCalendars linked from rows, ical_workers at
+        a time. iCalendar() waits for each one when it is asked for.
+        """
+        executor = ThreadPoolExecutor(max_workers=self.ical_workers)
+        for row in rows :
+            for link in xpaths.ROW_LINKS(row) :
+                address = self._get_link_address(link)
+                if (address and 'View.ashx?M=IC' in address
+                        and address not in self._icalendars) :
+                    self._icalendars[address] = executor.submit(self._fetchICalendar, address)
+
+        # Let the fetches finish in the background, so a table that is
+        # abandoned doesn't wait for them
+        executor.shutdown(wait=False)
+
+    def iCalendar(self, url) :
+        """
+        Return the iCalendar at url, fetching it only the first time
+        it's asked for
+        """
+        calendar = self._icalendars.get(url)
+        if calendar is None :
+            calendar = self._icalendars[url] = self._fetchICalendar(url)
+        elif isinstance(calendar, Future) :
+            calendar = self._icalendars[url] = calendar.result()
+        return calendar
+
+    def _fetchICalendar(self, url) :
+        response = self._get(url, verify=False)
+        return icalendar.Calendar.from_ical(response.text)
+
+    def _headerKeys(self, table) :
+        headers = xpaths.GRID_HEADERS(table)
 
         keys = []
         for header in headers :
@@ -96,39 +481,152 @@ class LegistarScraper(Scraper):
             if text_content :
                 keys.append(text_content)
             else :
-                keys.append(header.xpath('.//input')[0].value)
+                keys.append(xpaths.HEADER_INPUTS(header)[0].value)
 
-        for row in rows:
-            try:
+        return keys
+
+    def _rowSchema(self, keys) :
+        if not self.compact_rows :
+            return None
+
+        schema = GridSchema(keys)
+        # _parseRow keeps the iCalendar link of an events grid under
+        # its own key
+        if '' in schema.indexes :
+            schema.index('iCalendar')
+        return schema
+
+    def _parseRow(self, keys, row, schema=None) :
+        try:
+            if schema is None :
                 data = defaultdict(lambda : None)
+            else :
+                data = GridRow(schema)
 
-                for key, field in zip(keys, row.xpath("./td")):
-                    text_content = self._stringify(field)
-
-                    if field.find('.//a') is not None :
-                        address = self._get_link_address(field.find('.//a'))
-                        if address :
-                            if key == '' and 'View.ashx?M=IC' in address :
-                                req = self.get(address, verify=False)
-                                value = icalendar.Calendar.from_ical(req.text)
-                                key = 'iCalendar'
-                            else :
-                                value = {'label': text_content, 
-                                         'url': address}
+            for key, field in zip(keys, xpaths.ROW_CELLS(row)):
+                text_content = self._stringify(field)
+
+                if field.find('.//a') is not None :
+                    address = self._get_link_address(field.find('.//a'))
+                    if address :
+                        if key == '' and 'View.ashx?M=IC' in address :
+                            value = LazyCalendar(self, address)
+                            key = 'iCalendar'
                         else :
-                            value = text_content
+                            value = {'label': text_content, 
+                                     'url': address}
                     else :
                         value = text_content
+                else :
+                    value = text_content
 
-                    data[key] = value
+                data[key] = value
 
-                yield data, keys, row
+            return data
+
+        except Exception as e:
+            print('Problem parsing row:')
+            print(etree.tostring(row))
+            print(traceback.format_exc())
+            raise e
+
+    def gridRows(self, url, payload, table_xpath=GRID_TABLE, page_size=None,
+                 regions=None) :
+        """
+        Yield the parseDataTable rows of every page of a search grid.
+
+        With grid_export set, we first try to download the whole grid
+        with its Export to Excel command. If the grid has no export, or
+        the export comes back short, we page through the grid as usual,
+        picking up after the rows the export gave us.
+        """
+        pages = self.pages(url, payload, page_size=page_size, regions=regions,
+                           table_xpath=table_xpath)
+        first_page = next(pages)
+
+        exported = 0
+        if self.grid_export :
+            expected = gridItemCount(first_page, table_xpath)
+            for row in self._exportRows(url, payload, first_page, table_xpath) :
+                yield row
+                exported += 1
+
+            if exported and exported >= expected :
+                pages.close()
+                return
+            elif exported :
+                self.warning('Export of {0} stopped after {1} of {2} rows, paging through the rest'.format(url, exported, expected))
+
+        for page in itertools.chain([first_page], pages) :
+            table = xpaths.compiled(table_xpath)(page)[0]
+            for row in self.parseDataTable(table) :
+                if exported :
+                    exported -= 1
+                else :
+                    yield row
+
+    def _exportRows(self, url, payload, page, table_xpath) :
+        table = xpaths.compiled(table_xpath)(page)[0]
+
+        # Parse the rows of the page, to check the start of the export
+        # against
+        html_keys = self._headerKeys(table)
+        html_rows = deque(self._parseRow(html_keys, row)
+                          for row in xpaths.GRID_ROWS(table))
 
-            except Exception as e:
-                print('Problem parsing row:')
-                print(etree.tostring(row))
-                print(traceback.format_exc())
-                raise e
+        grid, table_view = gridTarget(table)
+
+        export_payload = dict(payload)
+        export_payload.update(self.sessionSecrets(page))
+        export_payload['__EVENTTARGET'] = grid
+        export_payload['__EVENTARGUMENT'] = 'FireCommand:{0};ExportToExcel;'.format(table_view)
+
+        try :
+            response = self.post(url, export_payload, verify=False, stream=True)
+        except scrapelib.HTTPError as e :
+            self.warning('Could not export {0}: {1}'.format(url, e))
+            return
+
+        # If the grid has no export, we just get the search page back
+        if 'attachment' not in response.headers.get('Content-Disposition', '') :
+            self.warning('{0} has no grid export'.format(url))
+            response.close()
+            return
+
+        # The Excel export is an HTML table, which we parse as it
+        # arrives, a row at a time
+        parser = etree.HTMLPullParser(events=('end',), tag='tr')
+        parser.set_element_class_lookup(lxml.html.HtmlElementClassLookup())
+
+        keys = schema = None
+        for chunk in response.iter_content(chunk_size=EXPORT_CHUNK_SIZE) :
+            parser.feed(chunk)
+            for _, row in parser.read_events() :
+                if keys is None :
+                    keys = [header.text_content().replace('&nbsp;', ' ').strip()
+                            for header in xpaths.EXPORT_CELLS(row)]
+                    schema = self._rowSchema(keys)
+                    continue
+
+                row.make_links_absolute(url)
+                data = self._parseRow(keys, row, schema)
+
+                # Make sure the export has the same links as the page,
+                # since that's where a lot of the data is
+                if html_rows :
+                    html_data = html_rows.popleft()
+                    if keys != html_keys or any(isinstance(html_data[key], dict) != isinstance(data[key], dict)
+                                                for key in keys) :
+                        self.warning('Export of {0} does not match the grid, paging through it instead'.format(url))
+                        response.close()
+                        return
+
+                # Take the row out of the export's tree, so the tree
+                # doesn't grow with every row. The row itself is the
+                # caller's to keep.
+                row.getparent().remove(row)
+
+                yield data, keys, row
 
     def _get_link_address(self, link):
         url = None
@@ -140,17 +638,12 @@ class LegistarScraper(Scraper):
                                         "OpenTelerikWindow"))):
                 url = self.BASE_URL + onclick.split("'")[1]
         elif 'href' in link.attrib : 
-            url = link.attrib['href']
+            url = urljoin(link.base_url, link.attrib['href'].strip())
 
         return url
 
     def _stringify(self, field) :
-        for br in field.xpath("*//br"):
-            br.tail = "\n" + br.tail if br.tail else "\n"
-        for em in field.xpath("*//em"):
-            if em.text :
-                em.text = "--em--" + em.text + "--em--"
-        return field.text_content().replace('&nbsp;', ' ').strip()
+        return cellText(field).replace('&nbsp;', ' ').strip()
 
     def toTime(self, text) :
         time = datetime.datetime.strptime(text, self.date_format)
@@ -171,14 +664,344 @@ class LegistarScraper(Scraper):
 
         payload = {}
         payload['__EVENTARGUMENT'] = None
-        payload['__VIEWSTATE'] = page.xpath("//input[@name='__VIEWSTATE']/@value")[0]
+        payload['__VIEWSTATE'] = xpaths.VIEWSTATE(page)[0]
         try :
-            payload['__EVENTVALIDATION'] = page.xpath("//input[@name='__EVENTVALIDATION']/@value")[0]
+            payload['__EVENTVALIDATION'] = xpaths.EVENTVALIDATION(page)[0]
         except IndexError :
             pass
 
         return(payload)
 
+_parsers = threading.local()
+
+def htmlParser(encoding=None) :
+    """
+    Return an HTML parser for encoding. Parsers are made once per
+    thread, since a parser can only parse one document at a time.
+    """
+    parsers = getattr(_parsers, 'parsers', None)
+    if parsers is None :
+        parsers = _parsers.parsers = {}
+
+    parser = parsers.get(encoding)
+    if parser is None :
+        # We never read comments or processing instructions, and we
+        # don't look elements up by id through lxml's id table
+        parser = parsers[encoding] = lxml.html.HTMLParser(encoding=encoding,
+                                                          remove_comments=True,
+                                                          remove_pis=True,
+                                                          collect_ids=False)
+    return parser
+
+ATTRIBUTE = re.compile(rb'([\w:-]+)="([^"]*)"')
+
+def parseRegions(content, regions, encoding='utf-8', base_url=None) :
+    """
+    Parse only the elements with the given ids, and the hidden form
+    fields, out of the raw bytes of a page. Legistar pages are mostly
+    ViewState, menus and scripts, so this makes a much smaller tree.
+
+    Returns None if any of the regions can't be found.
+    """
+    fragments = []
+    for region in regions :
+        fragment = findElement(content, region.encode('ascii'))
+        if fragment is None :
+            return None
+        fragments.append(fragment)
+
+    document = b''.join([b'<html><body><form>'] + fragments + [b'</form></body></html>'])
+    page = lxml.html.document_fromstring(document,
+                                         parser=htmlParser(encoding),
+                                         base_url=base_url)
+
+    # The hidden inputs are made directly, rather than parsed, because
+    # the HTML parser is slow on an attribute as big as the ViewState
+    form = page.find('body/form')
+    for attributes in hiddenInputs(content, encoding) :
+        form.insert(0, page.makeelement('input', attributes))
+
+    return page
+
+def hiddenInputs(content, encoding='utf-8') :
+    """
+    Return the attributes of every hidden input on the page
+    """
+    # bytes.find is much faster than a regular expression over the
+    # hundreds of KB of a ViewState
+    inputs = []
+    start = content.find(b'<input')
+    while start != -1 :
+        end = content.find(b'>', start)
+        if end == -1 :
+            break
+        if content.find(b'type="hidden"', start, end) != -1 :
+            inputs.append({name.decode(encoding) : html.unescape(value.decode(encoding))
+                           for name, value
+                           in ATTRIBUTE.findall(content, start, end)})
+        start = content.find(b'<input', end)
+
+    inputs.reverse()
+    return inputs
+
+def findElement(content, element_id) :
+    """
+    Return the raw bytes of the element with element_id, from its start
+    tag to its matching end tag
+    """
+    id_start = content.find(b' id="' + element_id + b'"')
+    if id_start == -1 :
+        return None
+
+    start = content.rfind(b'<', 0, id_start)
+    tag = re.match(rb'<(\w+)', content[start:start + 32])
+    if tag is None :
+        return None
+
+    tags = re.compile(rb'<(/?)' + tag.group(1) + rb'\b', re.IGNORECASE)
+
+    depth = 0
+    for match in tags.finditer(content, start) :
+        if match.group(1) :
+            depth -= 1
+            if depth == 0 :
+                end = content.find(b'>', match.end())
+                return content[start:end + 1]
+        else :
+            depth += 1
+
+    return None
+
+class GridSchema(object) :
+    """
+    The keys of the rows of one data table, and where each row keeps
+    the value of each key. Keys added to any row are added here, so
+    all the rows of a table share one schema.
+    """
+    def __init__(self, keys=()) :
+        self.indexes = {}
+        self._counter = itertools.count()
+        for key in keys :
+            self.index(key)
+
+    def index(self, key) :
+        index = self.indexes.get(key)
+        if index is None :
+            # setdefault keeps two threads from giving a key different
+            # indexes, and next() keeps them from giving two keys the
+            # same one
+            index = self.indexes.setdefault(key, next(self._counter))
+        return index
+
+class _Unset(object) :
+    """
+    Marks a key a GridRow doesn't have. Copies and pickles of it are
+    the same object.
+    """
+    def __reduce__(self) :
+        return '_UNSET'
+
+    def __repr__(self) :
+        return '_UNSET'
+
+_UNSET = _Unset()
+
+class GridRow(MutableMapping) :
+    """
+    A row of a data table, made by parseDataTable instead of a dict
+    when compact_rows is set. Keys are kept once, in the table's
+    GridSchema, and each row only keeps a list of values.
+
+    Like the defaultdicts it stands in for, row[key] is None for a key
+    the row doesn't have. dict(row) makes a plain dict of it.
+    """
+    __slots__ = ('_schema', '_values')
+
+    def __init__(self, schema) :
+        self._schema = schema
+        self._values = [_UNSET] * len(schema.indexes)
+
+    def _lookup(self, key) :
+        index = self._schema.indexes.get(key)
+        if index is not None and index < len(self._values) :
+            value = self._values[index]
+            if value is not _UNSET :
+                return value
+        raise KeyError(key)
+
+    def __getitem__(self, key) :
+        try :
+            return self._lookup(key)
+        except KeyError :
+            return None
+
+    def __setitem__(self, key, value) :
+        index = self._schema.indexes.get(key)
+        if index is None :
+            index = self._schema.index(key)
+
+        values = self._values
+        if index >= len(values) :
+            values.extend([_UNSET] * (index + 1 - len(values)))
+        values[index] = value
+
+    def __delitem__(self, key) :
+        self._lookup(key)
+        self._values[self._schema.indexes[key]] = _UNSET
+
+    def __iter__(self) :
+        values = self._values
+        for key, index in list(self._schema.indexes.items()) :
+            if index < len(values) and values[index] is not _UNSET :
+                yield key
+
+    def __len__(self) :
+        return sum(1 for value in self._values if value is not _UNSET)
+
+    def __contains__(self, key) :
+        try :
+            self._lookup(key)
+        except KeyError :
+            return False
+        return True
+
+    def get(self, key, default=None) :
+        try :
+            return self._lookup(key)
+        except KeyError :
+            return default
+
+    def pop(self, key, *default) :
+        try :
+            value = self._lookup(key)
+        except KeyError :
+            if default :
+                return default[0]
+            raise
+        del self[key]
+        return value
+
+    def setdefault(self, key, default=None) :
+        try :
+            return self._lookup(key)
+        except KeyError :
+            self[key] = default
+            return default
+
+    def __repr__(self) :
+        return 'GridRow({0!r})'.format(dict(self))
+
+class LazyCalendar(object) :
+    """
+    Stands in for the icalendar.Calendar at url, which is only fetched
+    when it's first used
+    """
+    def __init__(self, scraper, url) :
+        self.url = url
+        self._scraper = scraper
+
+    @property
+    def calendar(self) :
+        return self._scraper.iCalendar(self.url)
+
+    def __getattr__(self, name) :
+        if name.startswith('_') :
+            raise AttributeError(name)
+        return getattr(self.calendar, name)
+
+    def __getitem__(self, key) :
+        return self.calendar[key]
+
+    def __contains__(self, key) :
+        return key in self.calendar
+
+    def __iter__(self) :
+        return iter(self.calendar)
+
+    def __len__(self) :
+        return len(self.calendar)
+
+    def __repr__(self) :
+        return '<LazyCalendar {0}>'.format(self.url)
+
+def checkpointName(url, payload) :
+    """
+    Name the checkpoints of a search by its url and search fields. The
+    ViewState and other session fields change every time we load the
+    search form, so they are left out.
+    """
+    search = sorted((key, value) for key, value in (payload or {}).items()
+                    if key not in SESSION_FIELDS)
+    search = json.dumps([url, search], default=str)
+
+    return 'pages ' + hashlib.sha1(search.encode('utf-8')).hexdigest()
+
+def gridTarget(table) :
+    """
+    Return the postback targets of the grid that table belongs to: the
+    grid's, and the table view's, for FireCommand arguments
+    """
+    # The ids of a grid's elements are its ASP.NET unique ids, with
+    # underscores instead of dollar signs
+    table_view = table.attrib['id'].replace('_', '$')
+    grid = table_view.rsplit('$', 1)[0]
+
+    return grid, table_view
+
+def isOverridden(obj, cls, *names) :
+    """
+    Return True if obj's class overrides any of the named methods of cls
+    """
+    return any(getattr(type(obj), name) is not getattr(cls, name)
+               for name in names)
+
+def gridItemCount(page, table_xpath=GRID_TABLE) :
+    """
+    The number of rows in the grid that table_xpath finds, across all
+    its pages
+    """
+    table = xpaths.compiled(table_xpath)(page)[0]
+
+    # The pager is part of the grid's table, so look there first, in
+    # case the page has other grids
+    info = xpaths.TABLE_INFO(table) or xpaths.GRID_INFO(page)
+    if info :
+        match = re.search(r'(\d+)\s+items', info[0].text_content())
+        if match :
+            return int(match.group(1))
+
+    return gridRowCount(table)
+
+def gridRowCount(table) :
+    return len(xpaths.GRID_ROWS(table))
+
+def cellText(element) :
+    """
+    Return the text of a grid cell, like text_content(), but with a
+    newline for each <br> and --em-- around the text of each <em> below
+    the cell's own children. The tree is left as it is.
+    """
+    parts = []
+    _cellText(element, parts, 1)
+    return ''.join(parts)
+
+def _cellText(element, parts, depth) :
+    text = element.text
+    if text :
+        if depth > 2 and element.tag == 'em' :
+            text = '--em--' + text + '--em--'
+        parts.append(text)
+
+    for child in element :
+        # Comments and processing instructions have no text content,
+        # but their tails do
+        if isinstance(child.tag, str) :
+            _cellText(child, parts, depth + 1)
+            if depth > 1 and child.tag == 'br' :
+                parts.append('\n')
+        if child.tail :
+            parts.append(child.tail)
+
 def fieldKey(x) :
     field_id = x.attrib['id']
     field = re.split(r'hyp|lbl', field_id)[-1]
@@ -186,33 +1009,252 @@ def fieldKey(x) :
     field = field.rstrip('X21')
     return field
 
-class LegistarAPIScraper(Scraper):
+class LegistarAPIScraper(DedupeMixin, SharedThrottleMixin, Scraper):
     date_format = '%Y-%m-%dT%H:%M:%S'
-    
+
+    def __init__(self, *args, **kwargs) :
+        super(LegistarAPIScraper, self).__init__(*args, **kwargs)
+        self.select_supported = True
+        self.projection_stats = {'bytes_received' : 0, 'bytes_saved' : 0}
+        self._projection_ratios = {}
+        self.decode_stats = {'responses' : 0, 'seconds' : 0.0}
+        self._stats_lock = threading.Lock()
+
     def toTime(self, text) :
         time = datetime.datetime.strptime(text, self.date_format)
         time = pytz.timezone(self.TIMEZONE).localize(time)
         return time
 
-    def pages(self, url, params=None, item_key=None):
+    # The Legistar Web API returns at most 1000 rows per request
+    page_size = 1000
+
+    # Number of $skip windows to request at once. With more than one
+    # worker, we fetch the next several pages concurrently instead of
+    # waiting to see whether each page was full before asking for the
+    # next one.
+    page_workers = 1
+
+    # Page by filtering on `item_key gt <last seen key>` instead of by
+    # $skip. Each page costs the server the same and rows inserted
+    # mid-run can't shift results, so no dedupe window is needed.
+    keyset_pagination = False
+
+    # An object with get(jurisdiction, name) and set(jurisdiction, name,
+    # value) methods, like legistar.state.JSONStateStore. When set,
+    # scrapers that support it only ask for rows modified since the
+    # latest modification time seen in the last complete run.
+    state_store = None
+
+    # When a call asks for only some fields, sample each route once with
+    # and without $select so we can estimate the bytes we saved
+    measure_projection = False
+
+    # A legistar.cache.ConditionalCache. When set, GET requests are
+    # revalidated against the cache instead of downloaded in full.
+    response_cache = None
+
+    def pages(self, url, params=None, item_key=None, fields=None):
         if params is None:
             params = {}
-        
-        seen = deque([], maxlen=1000)
 
-        page_num = 0
-        while page_num == 0 or len(response.json()) == 1000 :
-            params['$skip'] = page_num * 1000
-            response = self.get(url, params=params)
+        if fields :
+            params = select(params, list(fields) + [item_key])
+
+        if self.keyset_pagination :
+            for page in self._keyset_pages(url, params, item_key) :
+                yield from page
+            return
 
-            for item in response.json() :
-                if item[item_key] not in seen :
+        # If an item is added while we are paging, later items shift
+        # down a page and we would see some of them twice
+        seen = self._dedupe(url)
+
+        for page in self._skip_pages(url, params) :
+            for item in page :
+                if not seen.seen(item[item_key]) :
                     yield item
-                    seen.append(item[item_key])
 
-            page_num += 1
+    def _skip_pages(self, url, params) :
+        if self.page_workers <= 1 :
+            page_num = 0
+            while True :
+                page = self._page(url, params, page_num)
+                yield page
+                if len(page) < self.page_size :
+                    return
+                page_num += 1
+
+        # We don't know how many pages there are, so we probe ahead
+        # `page_workers` pages at a time and stop at the first page
+        # that comes back short. Pages are yielded in order.
+        with ThreadPoolExecutor(max_workers=self.page_workers) as executor :
+            page_num = 0
+            while True :
+                futures = [executor.submit(self._page, url, params, n)
+                           for n in range(page_num,
+                                          page_num + self.page_workers)]
+                for future in futures :
+                    page = future.result()
+                    yield page
+                    if len(page) < self.page_size :
+                        for future in futures :
+                            future.cancel()
+                        return
+                page_num += self.page_workers
+
+    def _keyset_pages(self, url, params, item_key) :
+        last_key = None
+        while True :
+            page_params = dict(params)
+            page_params['$orderby'] = item_key
+            page_params['$top'] = self.page_size
+            if last_key is not None :
+                add_filter(page_params,
+                           '{0} gt {1}'.format(item_key, last_key))
+
+            page = self.decode(self._get(url, params=page_params))
+            yield page
+
+            if len(page) < self.page_size :
+                return
+            last_key = page[-1][item_key]
+
+    def high_water_mark(self, endpoint) :
+        if self.state_store is not None :
+            return self.state_store.get(self.BASE_URL, endpoint)
+
+    def modified_since(self, params, endpoint, modified_key) :
+        """
+        Add a $filter clause to params for rows modified since the
+        stored high water mark for endpoint, if there is one.
+        """
+        since = self.high_water_mark(endpoint)
+        if since :
+            add_filter(params,
+                       "{0} gt datetime'{1}'".format(modified_key, since))
+        return params
+
+    def incremental(self, endpoint, items, modified_key) :
+        """
+        Yield items, keeping track of the latest modification time we
+        see. Once items are exhausted, save it as the new high water
+        mark for endpoint. A run that stops partway doesn't update the
+        mark, so the next run will pick up what it missed.
+        """
+        latest = None
+        for item in items :
+            modified = item.get(modified_key)
+            if modified and (latest is None or modified > latest) :
+                latest = modified
+            yield item
+
+        if self.state_store is not None and latest is not None :
+            self.state_store.set(self.BASE_URL, endpoint, latest)
+
+    def _page(self, url, params, page_num) :
+        params = dict(params)
+        params['$skip'] = page_num * self.page_size
+        response = self._get(url, params=params)
+        return self.decode(response)
+
+    def decode(self, response) :
+        """
+        Decode a JSON response. All API responses should be decoded
+        here, so each is decoded once and we can see decoding time in
+        decode_stats.
+        """
+        return self.loads(response.content)
+
+    def loads(self, content) :
+        start = time.perf_counter()
+        data = json_loads(content)
+        elapsed = time.perf_counter() - start
+
+        with self._stats_lock :
+            self.decode_stats['responses'] += 1
+            self.decode_stats['seconds'] += elapsed
+
+        return data
+
+    def _get(self, url, params=None) :
+        """
+        GET an API url. If params has a $select the server rejects, we
+        stop using $select for the rest of the run and fetch full rows.
+        """
+        if params and '$select' in params :
+            if self.select_supported :
+                response = self._request(url, params)
+                if response.status_code == 400 :
+                    self.warning('$select rejected by {0}, fetching full '
+                                 'rows instead'.format(url))
+                    self.select_supported = False
+                else :
+                    self._record_projection(url, params, response)
+                    return response
+
+            params = {k : v for k, v in params.items() if k != '$select'}
+
+        return self._request(url, params)
+
+    def accept_response(self, response, **kwargs) :
+        # A server that doesn't support $select says so with a 400. We
+        # take that the first time, rather than have scrapelib retry
+        # it, and _get falls back to fetching full rows.
+        if response.status_code == 400 and '$select' in parse_qs(urlsplit(response.url).query) :
+            return True
+        return super(LegistarAPIScraper, self).accept_response(response, **kwargs)
+
+    def _request(self, url, params) :
+        if self.response_cache is not None :
+            return self.response_cache.get(self, url, params=params)
+        return self.get(url, params=params)
+
+    def _record_projection(self, url, params, response) :
+        received = len(response.content)
+        saved = 0
+
+        if self.measure_projection :
+            route = re.sub(r'/\d+', '/{id}', url)
+            if route not in self._projection_ratios :
+                self._projection_ratios[route] = self._projection_ratio(url, params)
+            saved = int(received * (self._projection_ratios[route] - 1))
+
+        with self._stats_lock :
+            self.projection_stats['bytes_received'] += received
+            self.projection_stats['bytes_saved'] += saved
+
+        self.debug('{0}: {1} bytes with $select, about {2} saved'.format(url, received, saved))
+
+    def _projection_ratio(self, url, params) :
+        sample_params = {k : v for k, v in params.items() if k != '$skip'}
+        sample_params['$top'] = 1
+        projected = len(self.get(url, params=sample_params).content)
+
+        del sample_params['$select']
+        full = len(self.get(url, params=sample_params).content)
 
+        return full / projected if projected else 1
 
 
+def add_filter(params, clause) :
+    """
+    AND an OData $filter clause onto any filter already in params
+    """
+    if params.get('$filter') :
+        params['$filter'] = '({0}) and {1}'.format(params['$filter'], clause)
+    else :
+        params['$filter'] = clause
 
+def select(params, fields) :
+    """
+    Return a copy of params that only asks for the given fields
+    """
+    params = dict(params)
+    params['$select'] = ','.join(sorted(set(fields)))
+    return params
 
+def odata_datetime(value) :
+    """
+    Format a date or datetime as an OData datetime literal
+    """
+    return "datetime'{0}'".format(value.strftime('%Y-%m-%dT%H:%M:%S'))
@@ -1,29 +1,150 @@
-from .base import LegistarScraper, LegistarAPIScraper
+from .base import (LegistarScraper, LegistarAPIScraper, select, gridItemCount,
+                   isOverridden)
+from .jsonstream import JSONObjectStream
+from . import xpaths
 from pupa.scrape import Scraper
 from lxml.etree import tostring
-from collections import deque
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
 from functools import partialmethod
+import codecs
 import datetime
+import itertools
+import json
 import pytz
-import requests
+import scrapelib
+import threading
+
+SEARCH_TABLE = "//table[@id='ctl00_ContentPlaceHolder1_gridMain_ctl00']"
+SEARCH_REGIONS = ['ctl00_ContentPlaceHolder1_gridMain_ctl00']
+
+DETAILS_DIV = 'ctl00_ContentPlaceHolder1_pageDetails'
+HISTORY_TABLE = 'ctl00_ContentPlaceHolder1_gridLegislation_ctl00'
+TEXT_DIV = 'ctl00_ContentPlaceHolder1_divText'
+
+SEARCH_SWITCHER = 'ctl00_ContentPlaceHolder1_btnSwitch'
 
 class LegistarBillScraper(LegistarScraper):
+    # Split legislation() searches into windows of creation dates,
+    # searched by legislation_search_workers at a time. See
+    # _windowedSearch.
+    legislation_windows = False
+    legislation_search_workers = 1
+
+    # If a search returns this many results, assume the server cut
+    # it off
+    search_result_cap = 1000
+
+    # Ask for the full text of legislation on every detail page. If
+    # False, detail urls leave out the text, which can be hundreds of KB,
+    # and only text() asks for it.
+    full_text = True
+
+    def __init__(self, *args, **kwargs) :
+        super(LegistarBillScraper, self).__init__(*args, **kwargs)
+        self.detail_bytes = Counter()
+        self.detail_pages = Counter()
+
     def legislation(self, search_text='', created_after=None, 
                     created_before=None) :
 
         # If legislation is added to the the legistar system while we
         # are scraping, it will shift the list of legislation down and
         # we might revisit the same legislation. So, we keep track of
-        # the last few pieces of legislation we've visited in order to
-        # make sure we are not revisiting
-        scraped_leg = deque([], maxlen=10)
-
-        for page in self.searchLegislation(search_text, created_after,
-                                           created_before) :
-            for legislation_summary in self.parseSearchResults(page) :
-                if not legislation_summary['url'] in scraped_leg :
-                    yield legislation_summary
-                    scraped_leg.append(legislation_summary['url'])
+        # the legislation we've visited in order to make sure we are
+        # not revisiting
+        scraped_leg = self._dedupe('legislation')
+
+        if isOverridden(self, LegistarBillScraper, 'searchLegislation', 'parseSearchResults') :
+            # A subclass that changes how we search, or how we read a
+            # page of results, gets them page by page, as it did before
+            # the searches below were added
+            results = (legislation
+                       for page in self.searchLegislation(search_text,
+                                                          created_after,
+                                                          created_before)
+                       for legislation in self.parseSearchResults(page))
+        elif self.legislation_windows and created_after :
+            results = self._windowedSearch(search_text, created_after,
+                                           created_before or self.now())
+        else :
+            payload = self._searchPayload(search_text, created_after,
+                                          created_before)
+            rows = self.gridRows(self.LEGISLATION_URL, payload,
+                                 table_xpath=SEARCH_TABLE,
+                                 page_size=self.grid_page_size,
+                                 regions=SEARCH_REGIONS)
+            results = self._searchResults(rows)
+
+        for legislation_summary in results :
+            if not scraped_leg.seen(legislation_summary['url']) :
+                yield legislation_summary
+
+    def _windowedSearch(self, search_text, created_after, created_before) :
+        """
+        Split a legislation search into windows of creation dates,
+        starting with a window per month. Windows are searched at the
+        same time, each in its own session, and their results are
+        yielded in date order. Legislation can turn up in more than one
+        window, so callers should drop repeats. A window with search_result_cap or more
+        results may have been cut off by the server, so we split it in
+        half and search each half instead.
+        """
+        def search(window) :
+            worker = self._worker()
+            payload = worker._searchPayload(search_text, *window)
+            pages = worker.pages(self.LEGISLATION_URL, payload,
+                                 page_size=self.grid_page_size,
+                                 regions=SEARCH_REGIONS,
+                                 table_xpath=SEARCH_TABLE)
+
+            first_page = next(pages)
+            count = gridItemCount(first_page, SEARCH_TABLE)
+            if self.search_result_cap and count >= self.search_result_cap :
+                if window[0] < window[1] :
+                    pages.close()
+                    return None
+                self.warning('{0} legislation created on {1}, results may be cut off'.format(count, window[0]))
+
+            return [legislation
+                    for page in itertools.chain([first_page], pages)
+                    for legislation in worker.parseSearchResults(page)]
+
+        # Each window is a [window, future] pair, and the future is None
+        # until we start searching it
+        pending = deque([window, None]
+                        for window in monthWindows(created_after,
+                                                   created_before))
+
+        with ThreadPoolExecutor(max_workers=self.legislation_search_workers) as executor :
+            def searchAhead() :
+                # Only search as many windows ahead as there are
+                # workers, so that we don't hold the results of every
+                # window at once
+                for entry in itertools.islice(pending, self.legislation_search_workers) :
+                    if entry[1] is None :
+                        entry[1] = executor.submit(search, entry[0])
+
+            searchAhead()
+            try :
+                while pending :
+                    window, future = pending.popleft()
+                    results = future.result()
+
+                    if results is None :
+                        halves = splitWindow(*window)
+                        pending.extendleft([half, None] for half in reversed(halves))
+                        searchAhead()
+                        continue
+
+                    searchAhead()
+                    yield from results
+            finally :
+                # If we stop early, don't start the searches we haven't
+                # gotten to
+                for _, future in pending :
+                    if future is not None :
+                        future.cancel()
 
     def searchLegislation(self, search_text='', created_after=None,
                           created_before=None):
@@ -31,7 +152,16 @@ class LegistarBillScraper(LegistarScraper):
         Submit a search query on the legislation search page, and return a list
         of summary results.
         """
+        payload = self._searchPayload(search_text, created_after,
+                                      created_before)
 
+        return self.pages(self.LEGISLATION_URL, payload,
+                          page_size=self.grid_page_size,
+                          regions=SEARCH_REGIONS,
+                          table_xpath=SEARCH_TABLE)
+
+    def _searchPayload(self, search_text='', created_after=None,
+                       created_before=None):
         page = self.lxmlize(self.LEGISLATION_URL)
 
         page = self._advancedSearch(page)
@@ -64,7 +194,7 @@ class LegistarBillScraper(LegistarScraper):
 
         payload.update(self.sessionSecrets(page))
 
-        return self.pages(self.LEGISLATION_URL, payload)
+        return payload
 
     def parseSearchResults(self, page) :
         """Take a page of search results and return a sequence of data
@@ -73,8 +203,11 @@ class LegistarBillScraper(LegistarScraper):
         ('Document ID', 'Document URL', 'Type', 'Status', 'Introduction Date'
         'Passed Date', 'Main Sponsor', 'Title')
         """
-        table = page.xpath("//table[@id='ctl00_ContentPlaceHolder1_gridMain_ctl00']")[0]
-        for legislation, headers, row in self.parseDataTable(table):
+        table = xpaths.compiled(SEARCH_TABLE)(page)[0]
+        return self._searchResults(self.parseDataTable(table))
+
+    def _searchResults(self, rows) :
+        for legislation, headers, row in rows:
             # Do legislation search-specific stuff
             # ------------------------------------
             # First column should be the ID of the record.
@@ -85,12 +218,14 @@ class LegistarBillScraper(LegistarScraper):
                 continue
             legislation_url = legislation[id_key]['url'].split(self.BASE_URL)[-1]
             legislation[id_key] = legislation_id
-            legislation['url'] = self.BASE_URL + legislation_url.split('&Options')[0] + '&FullText=1'
+            legislation['url'] = self.BASE_URL + legislation_url.split('&Options')[0]
+            if self.full_text :
+                legislation['url'] = fullTextUrl(legislation['url'])
 
             yield legislation
 
     def _advancedSearch(self, page) :
-        search_switcher = page.xpath("//input[@id='ctl00_ContentPlaceHolder1_btnSwitch']")[0]
+        search_switcher = xpaths.INPUT_BY_ID(page, id=SEARCH_SWITCHER)[0]
 
         if 'simple search' in search_switcher.value.lower() :
             return page
@@ -100,31 +235,66 @@ class LegistarBillScraper(LegistarScraper):
 
             page = self.lxmlize(self.LEGISLATION_URL, payload)
 
-            if 'simple search' not in page.xpath("//input[@id='ctl00_ContentPlaceHolder1_btnSwitch']")[0].value.lower() :
+            if 'simple search' not in xpaths.INPUT_BY_ID(page, id=SEARCH_SWITCHER)[0].value.lower() :
                 raise ValueError('Not on the advanced search page')
 
             return page
 
-    def details(self, detail_url, div_id) :
-        detail_page = self.lxmlize(detail_url)
+    def bill_bundle(self, detail_url) :
+        """
+        Fetch a legislation detail page once and return its details,
+        history and text together
+        """
+        page = self._detailPage(fullTextUrl(detail_url),
+                                [DETAILS_DIV, HISTORY_TABLE, TEXT_DIV])
+
+        return {'details' : self.legDetails(detail_url, page),
+                'history' : list(self.history(detail_url, page)),
+                'text' : self.text(detail_url, page)}
+
+    def _detailPage(self, detail_url, regions=None) :
+        """
+        Fetch and parse a legislation detail page, keeping count of the
+        bytes we download with and without the full text
+        """
+        response = self._fetchPage(detail_url)
+
+        kind = 'full_text' if 'FullText=1' in detail_url else 'without_text'
+        self.detail_bytes[kind] += len(response.content)
+        self.detail_pages[kind] += 1
+        self.debug('{0} bytes for {1}'.format(len(response.content), detail_url))
+
+        return self._parsePage(detail_url, response, regions)
+
+    def _detailUrl(self, detail_url) :
+        if self.full_text :
+            return detail_url
+        else :
+            return detail_url.replace('&FullText=1', '')
+
+    def details(self, detail_url, div_id, page=None) :
+        if page is None :
+            page = self._detailPage(self._detailUrl(detail_url), [div_id])
         
-        detail_div = detail_page.xpath(".//div[@id='%s']" % div_id)[0]
+        detail_div = xpaths.DIV_BY_ID(page, id=div_id)[0]
 
         return self.parseDetails(detail_div)
 
-    def legDetails(self, detail_url) :
-        div_id = 'ctl00_ContentPlaceHolder1_pageDetails'
-        return self.details(detail_url, div_id)
+    def legDetails(self, detail_url, page=None) :
+        div_id = DETAILS_DIV
+        return self.details(detail_url, div_id, page)
 
-    def actionDetails(self, detail_url) :
+    def actionDetails(self, detail_url, page=None) :
         div_id = 'ctl00_ContentPlaceHolder1_pageTop1'
-        return self.details(detail_url, div_id)
+        return self.details(detail_url, div_id, page)
 
-    def history(self, detail_url) :
-        detail_page = self.lxmlize(detail_url)
+    def history(self, detail_url, page=None) :
+        if page is None :
+            page = self._detailPage(self._detailUrl(detail_url),
+                                    [HISTORY_TABLE])
 
         try :
-            history_table = detail_page.xpath("//table[@id='ctl00_ContentPlaceHolder1_gridLegislation_ctl00']")[0]
+            history_table = xpaths.TABLE_BY_ID(page, id=HISTORY_TABLE)[0]
         except IndexError :
             print(detail_url)
             raise
@@ -146,10 +316,11 @@ class LegistarBillScraper(LegistarScraper):
 
         return (action_date, action_url)
 
-    def text(self, detail_url) :
-        detail_page = self.lxmlize(detail_url)
+    def text(self, detail_url, page=None) :
+        if page is None :
+            page = self._detailPage(fullTextUrl(detail_url), [TEXT_DIV])
 
-        text_div = detail_page.xpath("//div[@id='ctl00_ContentPlaceHolder1_divText']")
+        text_div = xpaths.DIV_BY_ID(page, id=TEXT_DIV)
 
         if len(text_div) :
             return tostring(text_div[0], pretty_print=True).decode()
@@ -162,7 +333,8 @@ class LegistarBillScraper(LegistarScraper):
     def extractVotes(self, action_detail_url) :
         action_detail_page = self.lxmlize(action_detail_url)
         try:
-            vote_table = action_detail_page.xpath("//table[@id='ctl00_ContentPlaceHolder1_gridVote_ctl00']")[0]
+            vote_table = xpaths.TABLE_BY_ID(action_detail_page,
+                                            id='ctl00_ContentPlaceHolder1_gridVote_ctl00')[0]
         except IndexError:
             self.warning("No votes found in table")
             return None, []
@@ -173,7 +345,8 @@ class LegistarBillScraper(LegistarScraper):
             vote_list.append((self.VOTE_OPTIONS.get(raw_option, raw_option), 
                               vote['Person Name']['label']))
 
-        action_detail_div = action_detail_page.xpath(".//div[@id='ctl00_ContentPlaceHolder1_pageTop1']")[0]
+        action_detail_div = xpaths.DIV_BY_ID(action_detail_page,
+                                             id='ctl00_ContentPlaceHolder1_pageTop1')[0]
         action_details = self.parseDetails(action_detail_div)
         result = action_details['Result'].lower()
 
@@ -195,6 +368,41 @@ def dateWithin(created_after, created_before) :
 
     return payload
 
+def fullTextUrl(detail_url) :
+    if 'FullText=1' in detail_url :
+        return detail_url
+    else :
+        return detail_url + '&FullText=1'
+
+def monthWindows(start, end) :
+    """
+    Split the dates from start to end, inclusive, into windows that
+    don't cross a month boundary
+    """
+    start, end = toDate(start), toDate(end)
+
+    windows = []
+    while start <= end :
+        if start.month == 12 :
+            next_month = datetime.date(start.year + 1, 1, 1)
+        else :
+            next_month = datetime.date(start.year, start.month + 1, 1)
+
+        window_end = min(end, next_month - datetime.timedelta(days=1))
+        windows.append((start, window_end))
+        start = next_month
+
+    return windows
+
+def splitWindow(start, end) :
+    middle = start + (end - start) // 2
+    return [(start, middle), (middle + datetime.timedelta(days=1), end)]
+
+def toDate(value) :
+    if isinstance(value, datetime.datetime) :
+        return value.date()
+    return value
+
 def dateBound(creation_date) :
     payload = {}
 
@@ -208,39 +416,120 @@ def dateBound(creation_date) :
 
     return payload
 
+TEXT_CHUNK_SIZE = 64 * 1024
+
+NULL_VOTES_MESSAGE = "The cast to value type 'System.Int32' failed because the materialized value is null. Either the result type's generic parameter or the query must use a nullable type."
+
+def isNullVotes(response) :
+    if response.status_code != 500 :
+        return False
+    try :
+        error = json.loads(response.text)
+    except ValueError :
+        return False
+
+    return (isinstance(error, dict) and
+            error.get('InnerException', {}).get('ExceptionMessage', '') == NULL_VOTES_MESSAGE)
+
 class LegistarAPIBillScraper(LegistarAPIScraper) :
 
-    def matters(self, since_date) :
-        since_date = datetime.datetime.strftime(since_date, '%Y-%m-%d')
-        params = {'$filter' : "MatterLastModifiedUtc gt datetime'{since_date}'".format(since_date = since_date)}
-        
+    def __init__(self, *args, **kwargs) :
+        super(LegistarAPIBillScraper, self).__init__(*args, **kwargs)
+        self._null_votes = None
+        self._null_votes_lock = threading.Lock()
+
+    def matters(self, since_date=None, fields=None) :
+        """
+        Yield matters modified after since_date. If since_date is None
+        and the scraper has a state_store, only the matters modified
+        since the last complete run are requested.
+
+        If fields is given, only those fields of each matter are
+        downloaded.
+        """
+        if fields :
+            fields = list(fields) + ['MatterLastModifiedUtc']
+
         matters_url = self.BASE_URL + '/matters'
 
-        for matter in self.pages(matters_url,
+        if since_date is None :
+            params = self.modified_since({}, 'matters', 'MatterLastModifiedUtc')
+            matters = self.pages(matters_url,
                                  params=params,
-                                 item_key="MatterId"):
-            yield matter
-        
+                                 item_key="MatterId",
+                                 fields=fields)
+            yield from self.incremental('matters', matters,
+                                        'MatterLastModifiedUtc')
+
+        else :
+            since_date = datetime.datetime.strftime(since_date, '%Y-%m-%d')
+            params = {'$filter' : "MatterLastModifiedUtc gt datetime'{since_date}'".format(since_date = since_date)}
 
-    def endpoint(self, route, *args) :
+            for matter in self.pages(matters_url,
+                                     params=params,
+                                     item_key="MatterId",
+                                     fields=fields):
+                yield matter
+
+    def endpoint(self, route, *args, fields=None) :
         url = self.BASE_URL + route
-        response = self.get(url.format(*args))
-        return response.json()
+        params = select({}, fields) if fields else None
+        response = self._get(url.format(*args), params=params)
+        return self.decode(response)
 
     topics = partialmethod(endpoint, '/matters/{0}/indexes')
     attachments = partialmethod(endpoint, '/matters/{0}/attachments')
-    code_sections = partialmethod(endpoint, 'matters/{0}/codesections')
+    code_sections = partialmethod(endpoint, '/matters/{0}/codesections')
 
     def votes(self, history_id) :
+        if history_id in self.null_votes() :
+            return []
+
         url = self.BASE_URL + '/eventitems/{0}/votes'.format(history_id)
-        response = requests.get(url)
-        if response.status_code == 200 :
-            return response.json()
-        elif response.status_code == 500 and response.json().get('InnerException', {}).get('ExceptionMessage', '') == "The cast to value type 'System.Int32' failed because the materialized value is null. Either the result type's generic parameter or the query must use a nullable type." :
+
+        response = self._get(url)
+
+        # Some event items have votes that the API can't serialize.
+        # These will always fail, so remember them and don't ask again
+        if isNullVotes(response) :
+            self._add_null_votes(history_id)
             return []
-        else :
-            response = self.get(url)
-            return response.json()
+
+        return self.decode(response)
+
+    # A legistar.state store, like JSONStateStore. When set, the event
+    # items whose votes the API can't return are remembered between
+    # runs, so we don't ask for them again. This is separate from
+    # state_store, which also makes sweeps incremental.
+    null_votes_store = None
+
+    def accept_response(self, response, **kwargs) :
+        # The API always fails the same way on null votes, so there's
+        # no point in scrapelib retrying. votes() handles the response.
+        if isNullVotes(response) :
+            return True
+        return super(LegistarAPIBillScraper, self).accept_response(response, **kwargs)
+
+    def null_votes(self) :
+        """
+        The ids of the event items whose votes the API can't return.
+        With a null_votes_store, these are kept between runs.
+        """
+        with self._null_votes_lock :
+            if self._null_votes is None :
+                stored = None
+                if self.null_votes_store is not None :
+                    stored = self.null_votes_store.get(self.BASE_URL, 'null_votes')
+                self._null_votes = set(stored or [])
+            return self._null_votes
+
+    def _add_null_votes(self, history_id) :
+        null_votes = self.null_votes()
+        with self._null_votes_lock :
+            null_votes.add(history_id)
+            if self.null_votes_store is not None :
+                self.null_votes_store.set(self.BASE_URL, 'null_votes',
+                                          sorted(null_votes))
 
     def history(self, matter_id) :
         actions = self.endpoint('/matters/{0}/histories', matter_id)
@@ -268,7 +557,19 @@ class LegistarAPIBillScraper(LegistarAPIScraper) :
         else:
             return []
 
-    def text(self, matter_id) :
+    # Largest matter text, in bytes, that text() will read into memory.
+    # Bigger texts are skipped. None means no limit. Texts streamed to
+    # sinks are never held in memory, so this doesn't apply to them.
+    text_size_limit = 21052630
+
+    def text(self, matter_id, sinks=None) :
+        """
+        Return the latest version of a matter's text. If sinks is given,
+        it should map text fields, like 'MatterTextPlain' and
+        'MatterTextRtf', to writable text file objects. Those fields are
+        streamed to the files as they are downloaded and the other
+        fields are returned.
+        """
         version_route = '/matters/{0}/versions'
         text_route = '/matters/{0}/texts/{1}'
 
@@ -277,9 +578,54 @@ class LegistarAPIBillScraper(LegistarAPIScraper) :
         latest_version = max(versions, key=lambda x : x['Value'])['Key']
         
         text_url = self.BASE_URL + text_route.format(matter_id, latest_version)
-        response = self.get(text_url, stream=True)
-        if int(response.headers['Content-Length']) < 21052630 :
-            return response.json()
+        response = self._streamUncached(text_url)
+
+        if sinks is not None :
+            return self._stream_text(response, sinks)
+
+        limit = self.text_size_limit
+        content_length = response.headers.get('Content-Length')
+
+        if limit is not None and content_length and int(content_length) >= limit :
+            self.warning('Skipping text of matter {0}, it is {1} bytes'.format(matter_id, content_length))
+            response.close()
+            return None
+
+        # Content-Length can be missing, so keep count as we go
+        content = bytearray()
+        for chunk in response.iter_content(chunk_size=TEXT_CHUNK_SIZE) :
+            content.extend(chunk)
+            if limit is not None and len(content) >= limit :
+                self.warning('Skipping text of matter {0}, it is over {1} bytes'.format(matter_id, limit))
+                response.close()
+                return None
+
+        return self.loads(bytes(content))
+
+    def _streamUncached(self, url) :
+        """
+        GET url with stream=True, skipping scrapelib's cache. The cache
+        reads the whole body of every response it stores, so streaming
+        through it would hold the text in memory, and write it to disk,
+        before we saw any of it. Throttling and retries still apply.
+        """
+        response = super(scrapelib.CachingSession, self).request('get', url,
+                                                                 stream=True,
+                                                                 timeout=self.timeout)
+        if self.raise_errors and not self.accept_response(response) :
+            response.close()
+            raise scrapelib.HTTPError(response)
+        return response
+
+    def _stream_text(self, response, sinks) :
+        decoder = codecs.getincrementaldecoder(response.encoding or 'utf-8')()
+        stream = JSONObjectStream(sinks)
+
+        for chunk in response.iter_content(chunk_size=TEXT_CHUNK_SIZE) :
+            stream.feed(decoder.decode(chunk))
+        stream.feed(decoder.decode(b'', final=True))
+
+        return stream.close()
 
     def legislation_detail_url(self, matter_id) :
         gateway_url = self.BASE_WEB_URL + '/gateway.aspx?m=l&id=/matter.aspx?key={0}'
@@ -288,3 +634,63 @@ class LegistarAPIBillScraper(LegistarAPIScraper) :
         
         return self.BASE_WEB_URL + legislation_detail_route
 
+    # Sub-resources fetched for every matter by matter_bundle. 'text'
+    # is left out, since a matter's text can be 20 MB and several
+    # matters are fetched at once. Add it in a subclass if you need it.
+    MATTER_RESOURCES = ('history', 'sponsors', 'topics', 'attachments',
+                        'code_sections', 'legislation_detail_url')
+
+    # Maximum number of requests matter_bundle and matter_bundles will
+    # have in flight at once
+    bundle_workers = 4
+
+    def matter_bundle(self, matter_id) :
+        """
+        Fetch all the sub-resources of a matter concurrently. Returns a
+        dictionary keyed by sub-resource name. If a sub-resource fails,
+        its value is None and the exception is stored under 'errors'.
+        """
+        with ThreadPoolExecutor(max_workers=self.bundle_workers) as executor :
+            futures = self._submit_bundle(executor, matter_id)
+            return self._collect_bundle(matter_id, futures)
+
+    def matter_bundles(self, matters) :
+        """
+        Take an iterable of matters, like the one returned by
+        `matters`, and yield a bundle for each matter, in order. The
+        requests for upcoming matters are made while earlier bundles
+        are being consumed, sharing one pool of `bundle_workers`.
+        """
+        with ThreadPoolExecutor(max_workers=self.bundle_workers) as executor :
+            pending = deque()
+            for matter in matters :
+                futures = self._submit_bundle(executor, matter['MatterId'])
+                pending.append((matter, futures))
+
+                if len(pending) > self.bundle_workers :
+                    yield self._matter_bundle(*pending.popleft())
+
+            while pending :
+                yield self._matter_bundle(*pending.popleft())
+
+    def _matter_bundle(self, matter, futures) :
+        bundle = self._collect_bundle(matter['MatterId'], futures)
+        bundle['matter'] = matter
+        return bundle
+
+    def _submit_bundle(self, executor, matter_id) :
+        return {resource : executor.submit(getattr(self, resource), matter_id)
+                for resource in self.MATTER_RESOURCES}
+
+    def _collect_bundle(self, matter_id, futures) :
+        bundle = {'MatterId' : matter_id, 'errors' : {}}
+
+        for resource, future in futures.items() :
+            try :
+                bundle[resource] = future.result()
+            except Exception as e :
+                self.warning('Could not fetch {0} for matter {1}: {2}'.format(resource, matter_id, e))
+                bundle[resource] = None
+                bundle['errors'][resource] = e
+
+        return bundle
@@ -0,0 +1,180 @@
+from urllib.parse import urlencode
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+
+class ConditionalCache(object):
+    """
+    A disk backed HTTP cache that revalidates responses with
+    If-None-Match and If-Modified-Since, so an unchanged page costs us
+    headers instead of a full download.
+
+    path: directory to keep cached responses in
+    max_bytes: once cached bodies take up more than this, the least
+        recently used responses are removed
+    ttls: a list of (regex, seconds) pairs. A cached response for a url
+        matching regex is served without asking the server at all if
+        it is younger than seconds. The first matching regex wins.
+    default_ttl: seconds to use for urls that match no regex in ttls
+    """
+    def __init__(self, path, max_bytes=512 * 1024 * 1024, ttls=(),
+                 default_ttl=0) :
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttls = [(re.compile(pattern), ttl) for pattern, ttl in ttls]
+        self.default_ttl = default_ttl
+        self.stats = {'fresh' : 0, 'revalidated' : 0, 'miss' : 0}
+
+        self._lock = threading.Lock()
+
+        os.makedirs(path, exist_ok=True)
+
+        # key -> (body size, last used), for LRU eviction
+        self._index = {}
+        for filename in os.listdir(path) :
+            if filename.endswith('.body') :
+                stat = os.stat(os.path.join(path, filename))
+                self._index[filename[:-5]] = (stat.st_size, stat.st_mtime)
+
+    def get(self, session, url, params=None, **kwargs) :
+        """
+        GET url with session, a requests.Session like a scraper,
+        serving the cached response when it is fresh or the server says
+        it has not changed
+        """
+        key = self._key(url, params)
+        entry = self._load(key)
+
+        if entry and time.time() - entry['stored'] < self._ttl(url) :
+            self._touch(key)
+            self._count('fresh')
+            return entry['response']
+
+        headers = dict(kwargs.pop('headers', None) or {})
+        if entry :
+            if entry['etag'] :
+                headers['If-None-Match'] = entry['etag']
+            if entry['last_modified'] :
+                headers['If-Modified-Since'] = entry['last_modified']
+
+        response = session.get(url, params=params, headers=headers, **kwargs)
+
+        if response.status_code == 304 and entry :
+            entry['stored'] = time.time()
+            self._save_meta(key, entry)
+            self._touch(key)
+            self._count('revalidated')
+            return entry['response']
+
+        self._count('miss')
+        if response.status_code == 200 :
+            self._store(key, url, response)
+
+        return response
+
+    def _ttl(self, url) :
+        for pattern, ttl in self.ttls :
+            if pattern.search(url) :
+                return ttl
+        return self.default_ttl
+
+    def _key(self, url, params) :
+        if params :
+            url += '?' + urlencode(sorted(params.items()))
+        return hashlib.sha1(url.encode('utf-8')).hexdigest()
+
+    def _filename(self, key, extension) :
+        return os.path.join(self.path, key + extension)
+
+    def _load(self, key) :
+        try :
+            with open(self._filename(key, '.json')) as f :
+                meta = json.load(f)
+            with open(self._filename(key, '.body'), 'rb') as f :
+                body = f.read()
+        except (OSError, ValueError) :
+            return None
+
+        response = requests.Response()
+        response.status_code = 200
+        response.url = meta['url']
+        response.headers = CaseInsensitiveDict(meta['headers'])
+        response.encoding = meta['encoding']
+        response._content = body
+        response.fromcache = True
+
+        meta['response'] = response
+
+        return meta
+
+    def _store(self, key, url, response) :
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+
+        # Responses without validators can only be served while they
+        # are fresh, which is pointless if they are never fresh
+        if not (etag or last_modified or self._ttl(url)) :
+            return
+
+        meta = {'url' : url,
+                'etag' : etag,
+                'last_modified' : last_modified,
+                'headers' : {k : v for k, v in response.headers.items()
+                             if k.lower() == 'content-type'},
+                'encoding' : response.encoding,
+                'stored' : time.time()}
+
+        body = response.content
+        self._write(self._filename(key, '.body'), body, 'wb')
+        self._save_meta(key, meta)
+
+        with self._lock :
+            self._index[key] = (len(body), time.time())
+            self._evict()
+
+    def _save_meta(self, key, meta) :
+        meta = {k : v for k, v in meta.items() if k != 'response'}
+        self._write(self._filename(key, '.json'), json.dumps(meta), 'w')
+
+    def _write(self, filename, data, mode) :
+        tmp_filename = '{0}.{1}.tmp'.format(filename, threading.get_ident())
+        with open(tmp_filename, mode) as f :
+            f.write(data)
+        os.replace(tmp_filename, filename)
+
+    def _touch(self, key) :
+        with self._lock :
+            if key in self._index :
+                self._index[key] = (self._index[key][0], time.time())
+        try :
+            os.utime(self._filename(key, '.body'))
+        except OSError :
+            pass
+
+    def _count(self, outcome) :
+        with self._lock :
+            self.stats[outcome] += 1
+
+    def _evict(self) :
+        total = sum(size for size, _ in self._index.values())
+        if total <= self.max_bytes :
+            return
+
+        by_last_used = sorted(self._index.items(), key=lambda item : item[1][1])
+        for key, (size, _) in by_last_used :
+            if total <= self.max_bytes :
+                break
+            for extension in ('.body', '.json') :
+                try :
+                    os.remove(self._filename(key, extension))
+                except OSError :
+                    pass
+            del self._index[key]
+            total -= size
@@ -0,0 +1,91 @@
+import hashlib
+import math
+
+
+class Dedupe(object):
+    """
+    Remember the keys of items we have yielded, like legislation urls,
+    so that items that turn up again can be dropped. Keys are kept in a
+    set, so this is exact, but it holds every key for the whole run.
+
+    Any object with the same `seen` method and `stats` can be used, see
+    the `dedupe` attribute of the scrapers.
+    """
+    def __init__(self) :
+        self.stats = {'items' : 0, 'duplicates' : 0}
+        self._keys = set()
+
+    def seen(self, key) :
+        """
+        Return True if key has been seen before, and remember it if not
+        """
+        if self._add(key) :
+            self.stats['items'] += 1
+            return False
+        else :
+            self.stats['duplicates'] += 1
+            return True
+
+    def _add(self, key) :
+        if key in self._keys :
+            return False
+        self._keys.add(key)
+        return True
+
+
+class BloomDedupe(Dedupe):
+    """
+    Like Dedupe, but in a fixed amount of memory, using a Bloom filter
+    sized for `capacity` keys. In exchange, a new key is sometimes
+    taken for one we have seen, and its item dropped. That happens with
+    about `error_rate` probability once `capacity` keys have been seen,
+    and more often after that.
+    """
+    def __init__(self, capacity=1000000, error_rate=1e-6) :
+        super(BloomDedupe, self).__init__()
+
+        self.size = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _add(self, key) :
+        # Derive all the bit positions from one digest, by double
+        # hashing
+        digest = hashlib.md5(repr(key).encode('utf-8')).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        step = int.from_bytes(digest[8:], 'little') | 1
+
+        new = False
+        for i in range(self.hashes) :
+            bit = (first + i * step) % self.size
+            byte, mask = bit >> 3, 1 << (bit & 7)
+            if not self._bits[byte] & mask :
+                self._bits[byte] |= mask
+                new = True
+
+        return new
+
+
+class DedupeMixin(object):
+    """
+    Gives a scraper indexes that drop items it has already yielded.
+    Each index is made by calling the scraper's `dedupe` attribute and
+    its stats are kept in `dedupe_stats` under the name it was made for.
+    """
+    # Called with no arguments to make the index that drops items we
+    # have already yielded, like legislation that turns up twice. The
+    # default, Dedupe, remembers every key of a run. For very large
+    # runs, functools.partial(BloomDedupe, capacity=...) takes a fixed
+    # amount of memory, but may drop a few new items.
+    dedupe = Dedupe
+
+    def __init__(self, *args, **kwargs) :
+        super(DedupeMixin, self).__init__(*args, **kwargs)
+
+        # The stats of each dedupe index we have made, by name
+        self.dedupe_stats = {}
+
+    def _dedupe(self, name) :
+        index = self.dedupe()
+        self.dedupe_stats[name] = index.stats
+        return index
@@ -1,58 +1,144 @@
 from pupa.scrape import Scraper
 
-from .base import LegistarScraper, LegistarAPIScraper
+from .base import (LegistarScraper, LegistarAPIScraper, add_filter,
+                   odata_datetime, isOverridden)
+from . import xpaths
 
 import time
 import datetime
+import itertools
 import pytz
 from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+EVENTS_TABLE = "//table[@class='rgMasterTable']"
+EVENTS_REGIONS = ['ctl00_ContentPlaceHolder1_gridCalendar_ctl00']
 
 class LegistarEventsScraper(LegistarScraper):
+    # Number of years of events to search at once, when scraping events
+    # since a given year
+    event_search_workers = 1
+
     def eventPages(self, since) :
 
         page = self.lxmlize(self.EVENTSPAGE)
 
+        for value in self._searchYears(since) :
+            yield from self.eventSearch(page, value)
+
+    def eventRows(self, since) :
+        """
+        Yield the parseDataTable rows of every event since the given
+        year, or of all events if since is None. If a subclass overrides
+        eventPages or eventSearch, the rows come from the pages they
+        return instead.
+        """
+        if isOverridden(self, LegistarEventsScraper, 'eventPages', 'eventSearch') :
+            for page in self.eventPages(since) :
+                table = xpaths.compiled(EVENTS_TABLE)(page)[0]
+                yield from self.parseDataTable(table)
+            return
+
+        years = self._searchYears(since)
+
+        if self.event_search_workers > 1 and len(years) > 1 :
+            yield from self._concurrentEventRows(years)
+            return
+
+        page = self.lxmlize(self.EVENTSPAGE)
+
+        for value in years :
+            yield from self._eventRows(page, value)
+
+    def _eventRows(self, page, value) :
+        return self.gridRows(self.EVENTSPAGE,
+                             self._eventSearchPayload(page, value),
+                             table_xpath=EVENTS_TABLE,
+                             page_size=self.grid_page_size,
+                             regions=EVENTS_REGIONS)
+
+    def _concurrentEventRows(self, years) :
+        """
+        Search each year at the same time, each in its own session, and
+        yield the rows in year order. The same meeting can turn up in
+        more than one search, so we only yield it the first time.
+        """
+        def search(value) :
+            worker = self._worker()
+            page = worker.lxmlize(self.EVENTSPAGE)
+            return list(worker._eventRows(page, value))
+
+        seen = self._dedupe('event_searches')
+        years = iter(years)
+        with ThreadPoolExecutor(max_workers=self.event_search_workers) as executor :
+            # Only search as many years ahead as there are workers, so
+            # that we don't hold the rows of every year at once
+            pending = deque(executor.submit(search, value)
+                            for value in itertools.islice(years, self.event_search_workers))
+            try :
+                while pending :
+                    rows = pending.popleft().result()
+                    for value in itertools.islice(years, 1) :
+                        pending.append(executor.submit(search, value))
+
+                    for event, keys, row in rows :
+                        details = event['Meeting Details']
+                        if type(details) == dict :
+                            if seen.seen(details['url']) :
+                                continue
+
+                        yield event, keys, row
+            finally :
+                # If we stop early, don't start the searches we haven't
+                # gotten to
+                for future in pending :
+                    future.cancel()
+
+    def _searchYears(self, since) :
         if since is None :
-            yield from self.eventSearch(page, 'All')
+            return ['All']
         else :
-            for year in range(since, self.now().year + 1) :
-                yield from self.eventSearch(page, str(year))
+            return [str(year) for year in range(since, self.now().year + 1)]
 
     def eventSearch(self, page, value) :
+            payload = self._eventSearchPayload(page, value)
+
+            return self.pages(self.EVENTSPAGE, payload,
+                              page_size=self.grid_page_size,
+                              regions=EVENTS_REGIONS,
+                              table_xpath=EVENTS_TABLE)
+
+    def _eventSearchPayload(self, page, value) :
             payload = self.sessionSecrets(page)
 
             payload['ctl00_ContentPlaceHolder1_lstYears_ClientState'] = '{"value":"%s"}' % value
 
             payload['__EVENTTARGET'] = 'ctl00$ContentPlaceHolder1$lstYears'
 
-            return self.pages(self.EVENTSPAGE, payload)
+            return payload
 
     def events(self, follow_links=True, since=None) :
         # If an event is added to the the legistar system while we
         # are scraping, it will shift the list of events down and
         # we might revisit the same event. So, we keep track of
-        # the last few events we've visited in order to
+        # the events we've visited in order to
         # make sure we are not revisiting
-        scraped_events = deque([], maxlen=10)
+        scraped_events = self._dedupe('events')
 
-        for page in self.eventPages(since) :
-            events_table = page.xpath("//table[@class='rgMasterTable']")[0]
-            for events, _, _ in self.parseDataTable(events_table) :
-                if follow_links and type(events["Meeting Details"]) == dict :
-                    detail_url = events["Meeting Details"]['url']
-                    if detail_url in scraped_events :
-                        continue
-                    else :
-                        scraped_events.append(detail_url)
+        for events, _, _ in self.eventRows(since) :
+            if follow_links and type(events["Meeting Details"]) == dict :
+                detail_url = events["Meeting Details"]['url']
+                if scraped_events.seen(detail_url) :
+                    continue
 
-                    meeting_details = self.lxmlize(detail_url)
+                meeting_details = self.lxmlize(detail_url)
 
-                    agenda = self.agenda(detail_url)
+                agenda = self.agenda(detail_url)
 
-                else :
-                    agenda = None
-                
-                yield events, agenda
+            else :
+                agenda = None
+            
+            yield events, agenda
 
     def agenda(self, detail_url) :
         page = self.lxmlize(detail_url)
@@ -62,9 +148,10 @@ class LegistarEventsScraper(LegistarScraper):
         payload.update({"__EVENTARGUMENT": "3:1",
                         "__EVENTTARGET":"ctl00$ContentPlaceHolder1$menuMain"})
         
-        for page in self.pages(detail_url, payload) :
-            agenda_table = page.xpath(
-                "//table[@id='ctl00_ContentPlaceHolder1_gridMain_ctl00']")[0]
+        for page in self.pages(detail_url, payload,
+                               regions=['ctl00_ContentPlaceHolder1_gridMain_ctl00']) :
+            agenda_table = xpaths.TABLE_BY_ID(
+                page, id='ctl00_ContentPlaceHolder1_gridMain_ctl00')[0]
             agenda = self.parseDataTable(agenda_table)
             yield from agenda
 
@@ -80,7 +167,8 @@ class LegistarEventsScraper(LegistarScraper):
     def extractRollCall(self, action_detail_url) :
         action_detail_page = self.lxmlize(action_detail_url)
         try:
-            rollcall_table = action_detail_page.xpath("//table[@id='ctl00_ContentPlaceHolder1_gridRollCall_ctl00']")[0]
+            rollcall_table = xpaths.TABLE_BY_ID(action_detail_page,
+                                                id='ctl00_ContentPlaceHolder1_gridRollCall_ctl00')[0]
         except IndexError:
             self.warning("No rollcall found in table")
             return []
@@ -97,10 +185,54 @@ class LegistarEventsScraper(LegistarScraper):
 
 
 class LegistarAPIEventScraper(LegistarAPIScraper):
-    def events(self):
+    def events(self, since=None, until=None, modified_since=None,
+               fields=None):
+        """
+        Yield events. The filters are sent to the server, so only
+        matching events are downloaded.
+
+        since, until: dates or datetimes bounding EventDate, inclusive
+        modified_since: date or datetime bounding EventLastModifiedUtc
+        fields: if given, only download these fields of each event
+
+        If no filters are given and the scraper has a state_store, only
+        events modified since the last complete run are requested.
+        """
         events_url = self.BASE_URL + '/events/'
 
-        for event in self.pages(events_url, item_key="EventId"):
+        if fields :
+            fields = list(fields) + ['EventDate', 'EventTime',
+                                     'EventLastModifiedUtc']
+
+        params = {}
+        if since is not None :
+            add_filter(params, 'EventDate ge {0}'.format(odata_datetime(since)))
+        if until is not None :
+            add_filter(params, 'EventDate le {0}'.format(odata_datetime(until)))
+
+        if modified_since is not None :
+            add_filter(params, 'EventLastModifiedUtc gt {0}'.format(odata_datetime(modified_since)))
+            events = self.pages(events_url,
+                                params=params,
+                                item_key="EventId",
+                                fields=fields)
+
+        elif since is None and until is None :
+            params = self.modified_since(params, 'events', 'EventLastModifiedUtc')
+            events = self.incremental('events',
+                                      self.pages(events_url,
+                                                 params=params,
+                                                 item_key="EventId",
+                                                 fields=fields),
+                                      'EventLastModifiedUtc')
+
+        else :
+            events = self.pages(events_url,
+                                params=params,
+                                item_key="EventId",
+                                fields=fields)
+
+        for event in events:
             start = self.toTime(event['EventDate'])
             start_time = time.strptime(event['EventTime'], '%I:%M %p')
             event['start'] = start.replace(hour=start_time.tm_hour,
@@ -112,9 +244,9 @@ class LegistarAPIEventScraper(LegistarAPIScraper):
     def agenda(self, event):
         agenda_url = self.BASE_URL + '/events/{}/eventitems'.format(event['EventId'])
 
-        response = self.get(agenda_url)
+        response = self._get(agenda_url)
 
-        for item in response.json():
+        for item in self.decode(response):
             if item['EventItemTitle']:
                 yield item
 
@@ -0,0 +1,201 @@
+import json
+import re
+
+ESCAPES = {'"' : '"', '\\' : '\\', '/' : '/', 'b' : '\b',
+           'f' : '\f', 'n' : '\n', 'r' : '\r', 't' : '\t'}
+WHITESPACE = ' \t\r\n'
+STRING_SPECIAL = re.compile(r'["\\]')
+KEY = re.compile(r'"(?:[^"\\]|\\.)*"')
+
+
+class JSONObjectStream(object):
+    """
+    Incrementally parse a JSON object, like a matter text, that is fed
+    to us in pieces. The string values of the keys in sinks are
+    written to the matching file objects as they arrive, instead of
+    being held in memory. Other values are parsed normally and returned
+    by close().
+    """
+    def __init__(self, sinks) :
+        self.sinks = sinks
+        self.values = {}
+
+        self._buffer = ''
+        self._state = self._object_start
+        self._key = None
+        self._raw = []
+        self._depth = 0
+        self._in_string = False
+
+    def feed(self, text) :
+        buffer = self._buffer = self._buffer + text
+        pos = 0
+        while pos < len(buffer) :
+            new_pos = self._state(pos)
+            if new_pos is None :
+                break
+            pos = new_pos
+        self._buffer = buffer[pos:]
+
+    def close(self) :
+        if self._state != self._done :
+            raise ValueError('JSON object ended early')
+        return self.values
+
+    # Each state takes the position in the buffer to start from and
+    # returns the position it got to, or None if it needs more input
+    def _skip_whitespace(self, pos) :
+        buffer = self._buffer
+        while pos < len(buffer) and buffer[pos] in WHITESPACE :
+            pos += 1
+        return pos
+
+    def _object_start(self, pos) :
+        pos = self._skip_whitespace(pos)
+        if pos == len(self._buffer) :
+            return None
+        if self._buffer[pos] != '{' :
+            raise ValueError('Expected a JSON object')
+        self._state = self._key_start
+        return pos + 1
+
+    def _key_start(self, pos) :
+        pos = self._skip_whitespace(pos)
+        if pos == len(self._buffer) :
+            return None
+
+        char = self._buffer[pos]
+        if char == ',' :
+            return pos + 1
+        elif char == '}' :
+            self._state = self._done
+            return pos + 1
+        elif char == '"' :
+            match = KEY.match(self._buffer, pos)
+            if match is None :
+                return None
+            self._key = json.loads(match.group(0))
+            self._state = self._colon
+            return match.end()
+        else :
+            raise ValueError('Unexpected {0!r} in JSON object'.format(char))
+
+    def _colon(self, pos) :
+        pos = self._skip_whitespace(pos)
+        if pos == len(self._buffer) :
+            return None
+        if self._buffer[pos] != ':' :
+            raise ValueError('Expected : after JSON key')
+        self._state = self._value_start
+        return pos + 1
+
+    def _value_start(self, pos) :
+        pos = self._skip_whitespace(pos)
+        if pos == len(self._buffer) :
+            return None
+
+        if self._buffer[pos] == '"' and self._key in self.sinks :
+            self._state = self._sink_string
+            return pos + 1
+
+        self._raw = []
+        self._depth = 0
+        self._in_string = False
+        self._state = self._raw_value
+        return pos
+
+    def _sink_string(self, pos) :
+        buffer = self._buffer
+        sink = self.sinks[self._key]
+
+        match = STRING_SPECIAL.search(buffer, pos)
+        if match is None :
+            sink.write(buffer[pos:])
+            return len(buffer)
+        elif match.start() > pos :
+            sink.write(buffer[pos:match.start()])
+            return match.start()
+        elif buffer[pos] == '"' :
+            self._state = self._key_start
+            return pos + 1
+        else :
+            return self._escape(pos, sink)
+
+    def _escape(self, pos, sink) :
+        buffer = self._buffer
+        if pos + 1 >= len(buffer) :
+            return None
+
+        char = buffer[pos + 1]
+        if char in ESCAPES :
+            sink.write(ESCAPES[char])
+            return pos + 2
+        elif char != 'u' :
+            raise ValueError('Invalid escape \\{0} in JSON string'.format(char))
+
+        if pos + 6 > len(buffer) :
+            return None
+        code = int(buffer[pos + 2:pos + 6], 16)
+
+        if 0xD800 <= code < 0xDC00 :
+            # The first half of a surrogate pair, which should be
+            # followed by the second half
+            if pos + 8 > len(buffer) :
+                return None
+            if buffer[pos + 6:pos + 8] != '\\u' :
+                sink.write('\ufffd')
+                return pos + 6
+            if pos + 12 > len(buffer) :
+                return None
+            low = int(buffer[pos + 8:pos + 12], 16)
+            sink.write(chr(0x10000 + ((code - 0xD800) << 10) + (low - 0xDC00)))
+            return pos + 12
+
+        elif 0xDC00 <= code < 0xE000 :
+            sink.write('\ufffd')
+        else :
+            sink.write(chr(code))
+        return pos + 6
+
+    def _raw_value(self, pos) :
+        buffer = self._buffer
+        start = pos
+
+        while pos < len(buffer) :
+            if self._in_string :
+                match = STRING_SPECIAL.search(buffer, pos)
+                if match is None :
+                    pos = len(buffer)
+                elif match.group(0) == '"' :
+                    self._in_string = False
+                    pos = match.end()
+                elif match.end() < len(buffer) :
+                    pos = match.end() + 1
+                else :
+                    # An escape split across two pieces of input
+                    self._raw.append(buffer[start:match.start()])
+                    return match.start() if match.start() > start else None
+                continue
+
+            char = buffer[pos]
+            if char == '"' :
+                self._in_string = True
+            elif char in '[{' :
+                self._depth += 1
+            elif self._depth :
+                if char in ']}' :
+                    self._depth -= 1
+            elif char in ',}]' :
+                self._raw.append(buffer[start:pos])
+                self.values[self._key] = json.loads(''.join(self._raw))
+                self._state = self._key_start
+                return pos
+            pos += 1
+
+        self._raw.append(buffer[start:])
+        return len(buffer)
+
+    def _done(self, pos) :
+        if self._skip_whitespace(pos) < len(self._buffer) :
+            raise ValueError('Unexpected data after JSON object')
+        return len(self._buffer)
@@ -1,7 +1,9 @@
 import datetime
 import pytz
+from urllib.parse import urljoin
 
 from .base import LegistarScraper, LegistarAPIScraper
+from . import xpaths
 from pupa.scrape import Scraper
 
 class LegistarPersonScraper(LegistarScraper):
@@ -19,26 +21,33 @@ class LegistarPersonScraper(LegistarScraper):
             payload['__EVENTTARGET'] = "ctl00$ContentPlaceHolder1$menuPeople"
             payload['__EVENTARGUMENT'] = self.ALL_MEMBERS
 
-        for page in self.pages(self.MEMBERLIST, payload) :
-            table = page.xpath(
-                "//table[@id='ctl00_ContentPlaceHolder1_gridPeople_ctl00']")[0]
+        for page in self.pages(self.MEMBERLIST, payload,
+                               page_size=self.grid_page_size,
+                               regions=['ctl00_ContentPlaceHolder1_gridPeople_ctl00'],
+                               table_xpath="//table[@id='ctl00_ContentPlaceHolder1_gridPeople_ctl00']") :
+            table = xpaths.TABLE_BY_ID(
+                page, id='ctl00_ContentPlaceHolder1_gridPeople_ctl00')[0]
 
             for councilman, headers, row in self.parseDataTable(table):
                 if follow_links and type(councilman['Person Name']) == dict:
 
                     detail_url = councilman['Person Name']['url']
                     councilman_details = self.lxmlize(detail_url)
-                    detail_div = councilman_details.xpath(".//div[@id='ctl00_ContentPlaceHolder1_pageDetails']")[0]
+                    detail_div = xpaths.DIV_BY_ID(councilman_details,
+                                                  id='ctl00_ContentPlaceHolder1_pageDetails')[0]
 
                     councilman.update(self.parseDetails(detail_div))
 
-                    img = councilman_details.xpath(
-                        "//img[@id='ctl00_ContentPlaceHolder1_imgPhoto']")
+                    img = xpaths.IMG_BY_ID(
+                        councilman_details, id='ctl00_ContentPlaceHolder1_imgPhoto')
                     if img :
-                        councilman['Photo'] = img[0].get('src')
+                        photo = img[0].get('src')
+                        if photo :
+                            photo = urljoin(img[0].base_url, photo)
+                        councilman['Photo'] = photo
 
-                    committee_table = councilman_details.xpath(
-                        "//table[@id='ctl00_ContentPlaceHolder1_gridDepartments_ctl00']")[0]
+                    committee_table = xpaths.TABLE_BY_ID(
+                        councilman_details, id='ctl00_ContentPlaceHolder1_gridDepartments_ctl00')[0]
                     committees = self.parseDataTable(committee_table)
 
                     yield councilman, committees
@@ -51,25 +60,32 @@ class LegistarAPIPersonScraper(LegistarAPIScraper):
 
     def body_types(self):
         body_types_url = self.BASE_URL + '/bodytypes/'
-        response = self.get(body_types_url)
+        response = self._get(body_types_url)
 
         types = {body_type['BodyTypeName'] : body_type['BodyTypeId']
-                 for body_type in response.json()}
+                 for body_type in self.decode(response)}
 
         return types
 
-    def bodies(self):
+    def bodies(self, fields=None):
         bodies_url = self.BASE_URL + '/bodies/'
 
-        for body in self.pages(bodies_url, item_key="BodyId"):
-            yield body
+        if fields :
+            fields = list(fields) + ['BodyLastModifiedUtc']
 
-    def body_offices(self, body):
+        params = self.modified_since({}, 'bodies', 'BodyLastModifiedUtc')
+        bodies = self.pages(bodies_url, params=params, item_key="BodyId",
+                            fields=fields)
+
+        yield from self.incremental('bodies', bodies, 'BodyLastModifiedUtc')
+
+    def body_offices(self, body, fields=None):
         body_id = body['BodyId']
 
         offices_url = self.BASE_URL + '/bodies/{}/OfficeRecords'.format(body_id)
 
-        for office in self.pages(offices_url, item_key="OfficeRecordId"):
+        for office in self.pages(offices_url, item_key="OfficeRecordId",
+                                 fields=fields):
             yield office
 
     def toDate(self, text) :
@@ -78,8 +94,8 @@ class LegistarAPIPersonScraper(LegistarAPIScraper):
     def person_sources_from_office(self, office):
         person_api_url = self.BASE_URL + '/persons/{OfficeRecordPersonId}'.format(**office)
         
-        response = self.get(person_api_url)
-        person_web_url = self.WEB_URL + '/PersonDetail.aspx?ID={PersonId}&GUID={PersonGuid}'.format(**response.json())
+        response = self._get(person_api_url)
+        person_web_url = self.WEB_URL + '/PersonDetail.aspx?ID={PersonId}&GUID={PersonGuid}'.format(**self.decode(response))
 
         return person_api_url, person_web_url
 
@@ -0,0 +1,86 @@
+from contextlib import closing
+import json
+import os
+import sqlite3
+import threading
+
+
+class JSONStateStore(object):
+    """
+    Keep scraper state, like the last modified time we have seen for an
+    API endpoint, in a local JSON file keyed by jurisdiction and name.
+
+    Any object with the same `get` and `set` methods can be used as a
+    state store, and with the same `delete` method as a checkpoint
+    store.
+    """
+    def __init__(self, path='legistar_state.json') :
+        self.path = path
+        self._lock = threading.Lock()
+
+    def get(self, jurisdiction, name) :
+        with self._lock :
+            return self._load().get(jurisdiction, {}).get(name)
+
+    def set(self, jurisdiction, name, value) :
+        with self._lock :
+            state = self._load()
+            state.setdefault(jurisdiction, {})[name] = value
+            self._save(state)
+
+    def delete(self, jurisdiction, name) :
+        with self._lock :
+            state = self._load()
+            if name in state.get(jurisdiction, {}) :
+                del state[jurisdiction][name]
+                if not state[jurisdiction] :
+                    del state[jurisdiction]
+                self._save(state)
+
+    def _save(self, state) :
+        # Write to a temporary file first, so an interrupted run can't
+        # leave us with a corrupt state file
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f :
+            json.dump(state, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+    def _load(self) :
+        try :
+            with open(self.path) as f :
+                return json.load(f)
+        except FileNotFoundError :
+            return {}
+
+
+class SQLiteStateStore(object):
+    """
+    Keep scraper state in a local SQLite database. Values must be JSON
+    serializable.
+    """
+    def __init__(self, path='legistar_state.db') :
+        self.path = path
+        self._lock = threading.Lock()
+        self._execute('CREATE TABLE IF NOT EXISTS state '
+                      '(jurisdiction TEXT, name TEXT, value TEXT, '
+                      ' PRIMARY KEY (jurisdiction, name))')
+
+    def get(self, jurisdiction, name) :
+        row = self._execute('SELECT value FROM state '
+                            'WHERE jurisdiction = ? AND name = ?',
+                            (jurisdiction, name))
+        if row :
+            return json.loads(row[0])
+
+    def set(self, jurisdiction, name, value) :
+        self._execute('INSERT OR REPLACE INTO state VALUES (?, ?, ?)',
+                      (jurisdiction, name, json.dumps(value)))
+
+    def delete(self, jurisdiction, name) :
+        self._execute('DELETE FROM state WHERE jurisdiction = ? AND name = ?',
+                      (jurisdiction, name))
+
+    def _execute(self, query, args=()) :
+        with self._lock, closing(sqlite3.connect(self.path)) as conn :
+            with conn :
+                return conn.execute(query, args).fetchone()
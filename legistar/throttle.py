@@ -0,0 +1,31 @@
+import threading
+import time
+
+
+class SharedThrottleMixin(object):
+    """
+    Make scrapelib's requests_per_minute a limit on all the requests a
+    scraper makes, from any thread and from any of its workers, rather
+    than on each of them.
+
+    scrapelib's own throttle keeps the time of the last request on the
+    scraper, so threads that share a scraper can race past it, and
+    workers, which copy the scraper, each throttle on their own. Here
+    every request takes the next free slot under a lock, and workers
+    share the slots because they share the objects made here.
+    """
+    def __init__(self, *args, **kwargs) :
+        super(SharedThrottleMixin, self).__init__(*args, **kwargs)
+        self._throttle_lock = threading.Lock()
+
+        # The earliest time the next request can be made
+        self._next_request = [0.0]
+
+    def _throttle(self) :
+        with self._throttle_lock :
+            now = time.time()
+            wait = self._next_request[0] - now
+            self._next_request[0] = max(now, self._next_request[0]) + self._request_frequency
+
+        if wait > 0 :
+            time.sleep(wait)
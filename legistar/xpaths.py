@@ -0,0 +1,57 @@
+"""
+Compiled XPath expressions for the pages we parse.
+
+element.xpath() compiles its expression every time it is called,
+which adds up for the expressions we run on every row and cell of a
+grid, so we compile them once here. Expressions that take an element
+id are called with it as a variable, e.g. TABLE_BY_ID(page, id=...).
+"""
+from lxml import etree
+
+_compiled = {}
+
+
+def compiled(path) :
+    """
+    Return path compiled, compiling it only the first time we see it.
+    Use this for expressions that are passed in, like table_xpath.
+    """
+    if isinstance(path, etree.XPath) :
+        return path
+
+    xpath = _compiled.get(path)
+    if xpath is None :
+        xpath = _compiled[path] = etree.XPath(path)
+    return xpath
+
+
+# Grids
+GRID_TABLE = compiled("//table[contains(@class, 'rgMasterTable')]")
+GRID_ROWS = compiled(".//tr[@class='rgRow' or @class='rgAltRow']")
+GRID_HEADERS = compiled(".//th[starts-with(@class, 'rgHeader')]")
+GRID_INFO = compiled("//div[contains(@class, 'rgInfoPart')]")
+TABLE_INFO = compiled(".//div[contains(@class, 'rgInfoPart')]")
+HEADER_INPUTS = compiled(".//input")
+ROW_CELLS = compiled("./td")
+ROW_LINKS = compiled("./td//a")
+EXPORT_CELLS = compiled("./th|./td")
+
+# Grid pager
+CURRENT_PAGE = compiled("//a[@class='rgCurrentPage']")
+NEXT_PAGE = compiled("//a[@class='rgCurrentPage']/following-sibling::a[1]")
+PAGE_LINKS = compiled("//a[@class='rgCurrentPage']/following-sibling::a")
+
+# Cells and detail fields
+LINKS = compiled(".//a")
+DETAIL_FIELDS = compiled(".//*[starts-with(@id, 'ctl00_ContentPlaceHolder1_lbl')"
+                         "     or starts-with(@id, 'ctl00_ContentPlaceHolder1_hyp')]")
+
+# Form fields
+VIEWSTATE = compiled("//input[@name='__VIEWSTATE']/@value")
+EVENTVALIDATION = compiled("//input[@name='__EVENTVALIDATION']/@value")
+INPUT_BY_ID = compiled("//input[@id=$id]")
+
+# Page sections
+TABLE_BY_ID = compiled("//table[@id=$id]")
+DIV_BY_ID = compiled(".//div[@id=$id]")
+IMG_BY_ID = compiled("//img[@id=$id]")
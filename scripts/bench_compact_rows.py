@@ -0,0 +1,96 @@
+"""
+Compare the rows parseDataTable makes with and without compact_rows:
+the memory each row takes, and the time to make it.
+
+    python scripts/bench_compact_rows.py [rows]
+
+"Container" numbers are for the row objects alone, filled with values
+that are shared between rows, so they leave out the cell strings,
+which take the same memory either way.
+"""
+from collections import defaultdict
+import os
+import sys
+import time
+import tracemalloc
+
+# Import legistar from this checkout, even when it isn't installed
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import lxml.html
+
+from legistar import xpaths
+from legistar.base import LegistarScraper, GridRow, GridSchema
+
+from bench_xpaths import synthetic_grid
+
+REPEAT = 5
+
+
+class Scraper(LegistarScraper) :
+    BASE_URL = 'https://example.legistar.com/'
+
+    def __init__(self) :
+        self._icalendars = {}
+
+
+def parsed_rows(table, compact) :
+    scraper = Scraper()
+    scraper.compact_rows = compact
+    return [data for data, _, _ in scraper.parseDataTable(table)]
+
+
+def containers(items, count, compact) :
+    rows = []
+    if compact :
+        schema = GridSchema(key for key, _ in items)
+        for _ in range(count) :
+            row = GridRow(schema)
+            for key, value in items :
+                row[key] = value
+            rows.append(row)
+    else :
+        for _ in range(count) :
+            row = defaultdict(lambda : None)
+            for key, value in items :
+                row[key] = value
+            rows.append(row)
+    return rows
+
+
+def measure(make, count) :
+    """
+    Return the seconds and bytes per row it takes make() to make count
+    rows, keeping them all
+    """
+    timings = []
+    for _ in range(REPEAT) :
+        start = time.perf_counter()
+        rows = make()
+        timings.append(time.perf_counter() - start)
+        del rows
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    rows = make()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    return min(timings) / count, (after - before) / count
+
+
+if __name__ == '__main__' :
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+
+    page = lxml.html.fromstring(synthetic_grid(count),
+                                base_url=Scraper.BASE_URL)
+    table = xpaths.GRID_TABLE(page)[0]
+    items = list(parsed_rows(table, False)[0].items())
+
+    print('{0} rows of {1} keys'.format(count, len(items)))
+    for label, make in (('parseDataTable', lambda compact : parsed_rows(table, compact)),
+                        ('container', lambda compact : containers(items, count, compact))) :
+        for compact in (False, True) :
+            seconds, size = measure(lambda : make(compact), count)
+            print('{0:>15} {1:>8}: {2:7.2f} us/row, {3:6.0f} bytes/row'.format(
+                label, 'GridRow' if compact else 'dict', seconds * 1e6, size))
@@ -0,0 +1,94 @@
+"""
+Compare parsing a whole Legistar grid page with parsing only the grid
+and the hidden form fields, on a synthetic page shaped like a large
+legislation search result.
+
+    python scripts/bench_region_parsing.py [rows] [viewstate KB]
+
+Peak memory is measured in a fresh subprocess for each mode, so the
+numbers don't include each other's garbage.
+"""
+import os
+import resource
+import subprocess
+import sys
+import time
+
+# Import legistar from this checkout, even when it isn't installed
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import lxml.html
+
+from legistar.base import parseRegions
+
+GRID = 'ctl00_ContentPlaceHolder1_gridMain_ctl00'
+REPEAT = 20
+
+
+def synthetic_page(rows=100, viewstate_kb=500) :
+    menu = ''.join('<li><a href="/Menu{0}.aspx">Menu item {0}</a>'
+                   '<ul><li><a href="/Sub{0}.aspx">Sub item</a></li></ul></li>'.format(i)
+                   for i in range(300))
+    script = '<script>' + 'var x = "<div>";' * 2000 + '</script>'
+
+    grid_rows = ''.join(
+        '<tr class="rgRow"><td><a href="LegislationDetail.aspx?ID={0}&amp;GUID=X">'
+        'Int {0}-2016</a></td><td>Introduction</td><td>Committee</td>'
+        '<td>A Local Law in relation to<br>thing {0}</td>'
+        '<td><a href="View.ashx?M=IC&amp;ID={0}">iCalendar</a></td></tr>'.format(i)
+        for i in range(rows))
+
+    page = ('<html><head>{script}</head><body><form>'
+            '<input type="hidden" name="__VIEWSTATE" id="__VIEWSTATE" value="{viewstate}" />'
+            '<input type="hidden" name="__EVENTVALIDATION" id="__EVENTVALIDATION" value="abc" />'
+            '<ul class="menu">{menu}</ul>'
+            '<div class="RadGrid"><table id="{grid}" class="rgMasterTable">'
+            '<thead><tr class="rgPager"><td><div class="rgInfoPart">{rows} items</div>'
+            '<a class="rgCurrentPage">1</a><a href="#">2</a></td></tr>'
+            '<tr><th>File #</th><th>Type</th><th>Status</th><th>Title</th><th>Cal</th></tr></thead>'
+            '<tbody>{grid_rows}</tbody></table></div>'
+            '{script}</form></body></html>').format(script=script,
+                                                    viewstate='A' * viewstate_kb * 1024,
+                                                    menu=menu,
+                                                    grid=GRID,
+                                                    rows=rows,
+                                                    grid_rows=grid_rows)
+
+    return page.encode('utf-8')
+
+
+def parse(content, mode) :
+    if mode == 'full' :
+        return lxml.html.fromstring(content.decode('utf-8'))
+    else :
+        return parseRegions(content, [GRID])
+
+
+def run(mode, rows, viewstate_kb) :
+    content = synthetic_page(rows, viewstate_kb)
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    timings = []
+    for _ in range(REPEAT) :
+        start = time.perf_counter()
+        page = parse(content, mode)
+        timings.append(time.perf_counter() - start)
+    elapsed = min(timings)
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline
+    elements = sum(1 for _ in page.iter())
+
+    print('{0:>8}: {1:7.2f} ms/page, {2:6d} elements, {3:7d} KB peak'.format(
+        mode, elapsed * 1000, elements, peak))
+
+
+if __name__ == '__main__' :
+    if len(sys.argv) > 1 and sys.argv[1] in ('full', 'regions') :
+        run(sys.argv[1], int(sys.argv[2]), int(sys.argv[3]))
+    else :
+        rows = sys.argv[1] if len(sys.argv) > 1 else '100'
+        viewstate_kb = sys.argv[2] if len(sys.argv) > 2 else '500'
+        print('{0} rows, {1} KB of ViewState'.format(rows, viewstate_kb))
+        for mode in ('full', 'regions') :
+            subprocess.check_call([sys.executable, __file__,
+                                   mode, rows, viewstate_kb])
@@ -0,0 +1,84 @@
+"""
+Time parseDataTable on a 100 row grid with the compiled expressions
+in legistar.xpaths, and again with each expression compiled on every
+call by element.xpath(), as it was before.
+
+    python scripts/bench_xpaths.py [saved_grid_page.html]
+
+Without a saved page, a synthetic legislation search grid is used.
+"""
+import os
+import sys
+import time
+
+# Import legistar from this checkout, even when it isn't installed
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import lxml.html
+from lxml import etree
+
+from legistar import xpaths
+from legistar.base import LegistarScraper
+
+REPEAT = 20
+
+
+class Scraper(LegistarScraper) :
+    BASE_URL = 'https://example.legistar.com/'
+
+    def __init__(self) :
+        self._icalendars = {}
+
+
+def synthetic_grid(rows=100) :
+    grid_rows = ''.join(
+        '<tr class="{1}"><td><a href="LegislationDetail.aspx?ID={0}&amp;GUID=X">'
+        'Int {0}-2016</a></td><td>Introduction</td><td><em>In Committee</em></td>'
+        '<td><span>A Local Law in relation to<br>thing {0}</span></td>'
+        '<td><a href="PersonDetail.aspx?ID={0}">Council Member {0}</a></td>'
+        '<td>1/{2}/2016</td></tr>'.format(i, 'rgRow' if i % 2 else 'rgAltRow', i % 28 + 1)
+        for i in range(rows))
+
+    return ('<html><body><table class="rgMasterTable"><thead><tr>'
+            '<th class="rgHeader">File #</th><th class="rgHeader">Type</th>'
+            '<th class="rgHeader">Status</th><th class="rgHeader">Title</th>'
+            '<th class="rgHeader">Sponsor</th><th class="rgHeader">Date</th>'
+            '</tr></thead><tbody>{0}</tbody></table></body></html>').format(grid_rows)
+
+
+def uncompiled(path) :
+    return lambda element, **variables : element.xpath(path, **variables)
+
+
+def run(page_source) :
+    scraper = Scraper()
+
+    page = lxml.html.fromstring(page_source, base_url=Scraper.BASE_URL)
+
+    timings = []
+    for _ in range(REPEAT) :
+        start = time.perf_counter()
+        rows = list(scraper.parseDataTable(xpaths.GRID_TABLE(page)[0]))
+        timings.append(time.perf_counter() - start)
+
+    return min(timings), len(rows)
+
+
+if __name__ == '__main__' :
+    if len(sys.argv) > 1 :
+        with open(sys.argv[1], 'rb') as f :
+            page_source = f.read()
+    else :
+        page_source = synthetic_grid()
+
+    compiled, rows = run(page_source)
+
+    for name, value in list(vars(xpaths).items()) :
+        if isinstance(value, etree.XPath) :
+            setattr(xpaths, name, uncompiled(value.path))
+
+    recompiled, _ = run(page_source)
+
+    print('{0} rows'.format(rows))
+    print('  compiled: {0:7.2f} us/row'.format(compiled / rows * 1e6))
+    print('recompiled: {0:7.2f} us/row'.format(recompiled / rows * 1e6))